@@ -0,0 +1,86 @@
+"""Comparar los motores de agregación de estadísticas (bucle y NumPy).
+
+Genera resultados ya resueltos para muchas temporadas sintéticas, comprueba que
+los dos motores devuelven exactamente lo mismo (también el orden de las claves)
+y mide cuánto tarda cada uno.
+
+Ejemplos:
+    python benchmarks/bench_aggregation.py
+    python benchmarks/bench_aggregation.py --seasons 75 --repeat 5
+"""
+import argparse
+import os
+import sys
+import time
+
+from fakes import synthetic_season
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def season_results(season, rounds):
+    """Resultados de una temporada sintética con la forma que devuelven los parse_*"""
+    data = synthetic_season(season, rounds=rounds)
+    driver_ids = {driver["driverId"]: 1000 * (season - 1950) + i for i, driver in enumerate(data["drivers"])}
+    team_ids = {team["name"]: 1000 * (season - 1950) + i for i, team in enumerate(data["constructors"])}
+    round_results = []
+    for round_number in range(1, rounds + 1):
+        key = str(round_number)
+        race = [{"driver_id": driver_ids[row["Driver"]["driverId"]], "team_id": team_ids[row["Constructor"]["name"]],
+                 "position": int(row["position"]), "points": int(float(row["points"])),
+                 "fastest_lap": row["FastestLap"]["rank"] == "1"} for row in data["results"][key]]
+        sprint = [{"driver_id": driver_ids[row["Driver"]["driverId"]], "team_id": team_ids[row["Constructor"]["name"]],
+                   "position": int(row["position"]), "points": int(float(row["points"]))}
+                  for row in data["sprint"].get(key, [])]
+        qualifying = [{"driver_id": driver_ids[row["Driver"]["driverId"]], "position": int(row["position"])}
+                      for row in data["qualifying"][key]]
+        round_results.append((race, sprint, qualifying))
+    return round_results
+
+def same_output(a, b):
+    """Igualdad exacta, incluido el orden de pilotos y equipos en cada ronda"""
+    return a == b and all(list(x[0]) == list(y[0]) and list(x[1]) == list(y[1]) for x, y in zip(a, b))
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Benchmark de los motores de agregación")
+    parser.add_argument("--seasons", type=int, default=75, help="temporadas sintéticas")
+    parser.add_argument("--rounds", type=int, default=24, help="rondas por temporada")
+    parser.add_argument("--repeat", type=int, default=3, help="repeticiones; se toma la mejor")
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT_DIR)
+    import main
+    if main.import_numpy() is None:
+        sys.exit("NumPy no está instalado: solo está disponible el motor loop.")
+
+    seasons = [season_results(season, args.rounds) for season in range(2025 - args.seasons + 1, 2026)]
+    # Incremental: la segunda mitad de cada temporada sobre los contadores de la primera
+    half = args.rounds // 2
+    incremental = [(main.aggregate_rounds_loop({}, {}, results[:half])[-1], results[half:]) for results in seasons]
+
+    mismatches = 0
+    for results in seasons:
+        mismatches += not same_output(main.aggregate_rounds_loop({}, {}, results),
+                                      main.aggregate_rounds_numpy({}, {}, results))
+    for (driver_stats, team_stats), results in incremental:
+        mismatches += not same_output(main.aggregate_rounds_loop(driver_stats, team_stats, results),
+                                      main.aggregate_rounds_numpy(driver_stats, team_stats, results))
+    rows = sum(len(part) for results in seasons for round_results in results for part in round_results)
+    print(f"{args.seasons} temporadas, {rows} filas de resultados: "
+          f"{'paridad exacta' if not mismatches else f'{mismatches} temporadas distintas'}")
+
+    timings = {}
+    for name, engine in (("loop", main.aggregate_rounds_loop), ("numpy", main.aggregate_rounds_numpy)):
+        best = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            for results in seasons:
+                engine({}, {}, results)
+            best = min(best, time.perf_counter() - start)
+        timings[name] = best
+        print(f"{name:<6} {best * 1000:>9.1f} ms  ({rows / best:,.0f} filas/s)")
+    print(f"numpy/loop: {timings['loop'] / timings['numpy']:.2f}x")
+    if mismatches:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main_cli()
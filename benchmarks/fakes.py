@@ -0,0 +1,389 @@
+"""Servidores locales que sustituyen a Jolpica y a Supabase/PostgREST en los benchmarks"""
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# Puntos de carrera y sprint del reglamento actual
+RACE_POINTS = [25, 18, 15, 12, 10, 8, 6, 4, 2, 1]
+SPRINT_POINTS = [8, 7, 6, 5, 4, 3, 2, 1]
+
+def synthetic_season(season, rounds=24, drivers=20, sprint_every=4):
+    """Generar una temporada sintética y determinista con el formato de los fixtures grabados"""
+    rnd = random.Random(season)
+    constructors = [{"constructorId": f"team_{i}", "name": f"Team {i}", "nationality": "British"}
+                    for i in range(drivers // 2)]
+    driver_list = [{"driverId": f"driver_{i}", "code": f"D{i:02d}", "givenName": f"Given{i}",
+                    "familyName": f"Family{i}", "nationality": "Spanish"} for i in range(drivers)]
+
+    races, results, sprint, qualifying = [], {}, {}, {}
+    for round_number in range(1, rounds + 1):
+        day = f"{season}-{3 + (round_number - 1) // 3:02d}-{1 + 9 * ((round_number - 1) % 3):02d}"
+        race = {
+            "season": str(season), "round": str(round_number), "raceName": f"Grand Prix {round_number}",
+            "date": day, "time": "14:00:00Z",
+            "Circuit": {"circuitId": f"circuit_{round_number}", "circuitName": f"Circuit {round_number}",
+                        "Location": {"locality": f"City {round_number}", "country": "Country"}},
+            "FirstPractice": {"date": day, "time": "10:30:00Z"},
+            "Qualifying": {"date": day, "time": "15:00:00Z"},
+        }
+        if round_number % sprint_every == 0:
+            race["SprintQualifying"] = {"date": day, "time": "11:30:00Z"}
+            race["Sprint"] = {"date": day, "time": "10:00:00Z"}
+        else:
+            race["SecondPractice"] = {"date": day, "time": "14:00:00Z"}
+            race["ThirdPractice"] = {"date": day, "time": "10:30:00Z"}
+        races.append(race)
+
+        order = rnd.sample(range(drivers), drivers)
+        fastest = rnd.randrange(drivers)
+        results[str(round_number)] = [{
+            "number": str(i + 1), "position": str(p + 1), "positionText": str(p + 1),
+            "points": str(RACE_POINTS[p] if p < len(RACE_POINTS) else 0),
+            "Driver": driver_list[i], "Constructor": constructors[i // 2],
+            "laps": "57", "status": "Finished",
+            "FastestLap": {"rank": "1" if i == fastest else str(2 + i % 10), "lap": "44"},
+        } for p, i in enumerate(order)]
+        qualifying[str(round_number)] = [{
+            "number": str(i + 1), "position": str(p + 1),
+            "Driver": driver_list[i], "Constructor": constructors[i // 2],
+        } for p, i in enumerate(rnd.sample(range(drivers), drivers))]
+        if round_number % sprint_every == 0:
+            sprint[str(round_number)] = [{
+                "number": str(i + 1), "position": str(p + 1), "positionText": str(p + 1),
+                "points": str(SPRINT_POINTS[p] if p < len(SPRINT_POINTS) else 0),
+                "Driver": driver_list[i], "Constructor": constructors[i // 2],
+            } for p, i in enumerate(rnd.sample(range(drivers), drivers))]
+
+    return {"season": season, "races": races, "drivers": driver_list, "constructors": constructors,
+            "results": results, "sprint": sprint, "qualifying": qualifying}
+
+def lap_time(milliseconds):
+    """Formatear milisegundos como los tiempos de vuelta de la API ("1:37.284")"""
+    minutes, rest = divmod(milliseconds, 60000)
+    return f"{minutes}:{rest / 1000:06.3f}"
+
+def load_season(season, rounds=24):
+    """Usar el fixture grabado de una temporada si existe; si no, uno sintético"""
+    path = os.path.join(FIXTURES_DIR, f"{season}.json")
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    return synthetic_season(season, rounds=rounds)
+
+class FakeJolpica:
+    """Servidor compatible con Ergast que reproduce fixtures, con 429 y latencia inyectados.
+
+    ``published`` limita por temporada las rondas con resultados, para simular
+    una temporada en curso.
+    """
+
+    RESULT_KEYS = {"results": "Results", "sprint": "SprintResults", "qualifying": "QualifyingResults"}
+
+    def __init__(self, seasons, throttle_rate=0.0, latency=0.0, retry_after="1", seed=0):
+        self.seasons = seasons
+        self.published = {}
+        self.throttle_rate = throttle_rate
+        self.latency = latency
+        self.retry_after = retry_after
+        self.requests = 0
+        self.throttled = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def published_rounds(self, season):
+        return self.published.get(season, len(self.seasons[season]["races"]))
+
+    def _page(self, qs, table, key, items, extra=None):
+        limit = int(qs.get("limit", ["30"])[0])
+        offset = int(qs.get("offset", ["0"])[0])
+        return {"MRData": {"limit": str(limit), "offset": str(offset), "total": str(len(items)),
+                           table: {**(extra or {}), key: items[offset:offset + limit]}}}
+
+    def _race_rows(self, qs, data, endpoint, rounds):
+        # La API pagina por fila de resultado, no por carrera
+        key = self.RESULT_KEYS[endpoint]
+        rows = [(round_number, row) for round_number in rounds
+                for row in data[endpoint].get(str(round_number), [])]
+        limit = int(qs.get("limit", ["30"])[0])
+        offset = int(qs.get("offset", ["0"])[0])
+        races = []
+        for round_number, row in rows[offset:offset + limit]:
+            if not races or races[-1]["round"] != str(round_number):
+                races.append({**data["races"][round_number - 1], key: []})
+            races[-1][key].append(row)
+        return {"MRData": {"limit": str(limit), "offset": str(offset), "total": str(len(rows)),
+                           "RaceTable": {"season": str(data["season"]), "Races": races}}}
+
+    @staticmethod
+    def _paged_race(qs, data, round_number, key, rows, group=None):
+        """Una carrera con las filas de la página pedida; ``group`` agrupa filas (vueltas)"""
+        limit = int(qs.get("limit", ["30"])[0])
+        offset = int(qs.get("offset", ["0"])[0])
+        items = rows[offset:offset + limit]
+        if group:
+            items = group(items)
+        races = [{**data["races"][round_number - 1], key: items}] if items else []
+        return {"MRData": {"limit": str(limit), "offset": str(offset), "total": str(len(rows)),
+                           "RaceTable": {"season": str(data["season"]), "round": str(round_number), "Races": races}}}
+
+    def _laps(self, qs, data, round_number):
+        # Tiempos sintéticos a partir del orden de carrera; la API pagina por tiempo, no por vuelta
+        order = sorted(data["results"].get(str(round_number), []), key=lambda row: int(row["position"]))
+        laps = int(order[0]["laps"]) if order else 0
+        rows = [(lap, {"driverId": row["Driver"]["driverId"], "position": str(position),
+                       "time": lap_time(90000 + 37 * position + 11 * lap)})
+                for lap in range(1, laps + 1) for position, row in enumerate(order, 1)]
+
+        def group(items):
+            grouped = []
+            for lap, timing in items:
+                if not grouped or grouped[-1]["number"] != str(lap):
+                    grouped.append({"number": str(lap), "Timings": []})
+                grouped[-1]["Timings"].append(timing)
+            return grouped
+
+        return self._paged_race(qs, data, round_number, "Laps", rows, group)
+
+    def _pitstops(self, qs, data, round_number):
+        # Una parada por piloto y una segunda para los de dorsal par
+        stops = []
+        for row in data["results"].get(str(round_number), []):
+            number = int(row["number"])
+            for stop, lap in enumerate((18 + number % 10, 40 + number % 5)[:1 + (number % 2 == 0)], 1):
+                stops.append({"driverId": row["Driver"]["driverId"], "lap": str(lap), "stop": str(stop),
+                              "time": f"15:{lap:02d}:{number % 60:02d}", "duration": f"{22 + number % 5}.{number:03d}"})
+        stops.sort(key=lambda stop: (int(stop["lap"]), stop["driverId"]))
+        return self._paged_race(qs, data, round_number, "PitStops", stops)
+
+    def _standings(self, data, endpoint, upto):
+        totals = {}
+        for round_number in range(1, upto + 1):
+            for kind in ("results", "sprint"):
+                for row in data[kind].get(str(round_number), []):
+                    entity = row["Driver"] if endpoint == "driverStandings" else row["Constructor"]
+                    key = entity.get("driverId") or entity.get("constructorId")
+                    points, _ = totals.get(key, (0, entity))
+                    totals[key] = (points + float(row.get("points", 0)), entity)
+        ordered = sorted(totals.values(), key=lambda item: -item[0])
+        if endpoint == "driverStandings":
+            items = [{"position": str(i + 1), "positionText": str(i + 1), "points": f"{points:g}",
+                      "wins": "0", "Driver": entity, "Constructors": []} for i, (points, entity) in enumerate(ordered)]
+            key = "DriverStandings"
+        else:
+            items = [{"position": str(i + 1), "positionText": str(i + 1), "points": f"{points:g}",
+                      "wins": "0", "Constructor": entity} for i, (points, entity) in enumerate(ordered)]
+            key = "ConstructorStandings"
+        lists = [{"season": str(data["season"]), "round": str(upto), key: items}] if items else []
+        return {"MRData": {"limit": "30", "offset": "0", "total": str(len(lists)),
+                           "StandingsTable": {"season": str(data["season"]), "StandingsLists": lists}}}
+
+    def route(self, path, qs):
+        """Responder a una ruta /ergast/f1/{temporada}[/{ronda}]/{endpoint}.json"""
+        match = re.match(r"^/ergast/f1/(\d{4})(?:/(\d+))?/(\w+)\.json$", path)
+        if not match or int(match.group(1)) not in self.seasons:
+            return 404, {"detail": "Not found"}
+        season = int(match.group(1))
+        data = self.seasons[season]
+        published = self.published_rounds(season)
+        round_number = int(match.group(2)) if match.group(2) else None
+        endpoint = match.group(3)
+
+        if endpoint == "races":
+            return 200, self._page(qs, "RaceTable", "Races", data["races"], {"season": str(season)})
+        if endpoint == "drivers":
+            return 200, self._page(qs, "DriverTable", "Drivers", data["drivers"], {"season": str(season)})
+        if endpoint == "constructors":
+            return 200, self._page(qs, "ConstructorTable", "Constructors", data["constructors"], {"season": str(season)})
+        if endpoint in self.RESULT_KEYS:
+            if round_number is not None:
+                rounds = [round_number] if round_number <= published else []
+            else:
+                rounds = range(1, published + 1)
+            return 200, self._race_rows(qs, data, endpoint, rounds)
+        if endpoint in ("laps", "pitstops") and round_number is not None:
+            if round_number > published:
+                return 200, self._paged_race(qs, data, round_number, "Laps", [])
+            handler = self._laps if endpoint == "laps" else self._pitstops
+            return 200, handler(qs, data, round_number)
+        if endpoint in ("driverStandings", "constructorStandings"):
+            upto = min(round_number or published, published)
+            return 200, self._standings(data, endpoint, upto)
+        return 404, {"detail": "Not found"}
+
+    def handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Cabeceras y cuerpo van en dos escrituras: sin esto cada petición espera al ACK retrasado
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                with server._lock:
+                    server.requests += 1
+                    throttle = server._random.random() < server.throttle_rate
+                    if throttle:
+                        server.throttled += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                if throttle:
+                    body = b'{"detail": "Too Many Requests"}'
+                    self.send_response(429)
+                    self.send_header("Retry-After", server.retry_after)
+                else:
+                    status, payload = server.route(url.path, parse_qs(url.query))
+                    body = json.dumps(payload).encode()
+                    self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+class FakePostgREST:
+    """Sustituto en memoria de los endpoints REST de Supabase que usa main.py"""
+
+    CONTROL_PARAMS = {"select", "offset", "limit", "on_conflict", "order", "columns"}
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.tables = {}
+        self.requests = 0
+        self.per_table = {}
+        self._ids = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _matches(row, column, condition):
+        operator, _, value = condition.partition(".")
+        stored = row.get(column)
+        if operator == "eq":
+            return stored is not None and str(stored).lower() == value.lower()
+        if operator == "is":
+            return stored is None if value == "null" else str(stored).lower() == value
+        if operator == "in":
+            return str(stored) in value.strip("()").split(",")
+        if operator == "gt":
+            return stored is not None and float(stored) > float(value)
+        raise ValueError(f"Operador no soportado: {condition}")
+
+    def _filter(self, rows, qs):
+        for column, conditions in qs.items():
+            if column in self.CONTROL_PARAMS:
+                continue
+            for condition in conditions:
+                rows = [row for row in rows if self._matches(row, column, condition)]
+        return rows
+
+    def _insert(self, table, row):
+        self._ids[table] = self._ids.get(table, 0) + 1
+        stored = {**row, "id": self._ids[table]}
+        self.tables.setdefault(table, []).append(stored)
+        return stored
+
+    def handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Cabeceras y cuerpo van en dos escrituras: sin esto cada petición espera al ACK retrasado
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _request(self):
+                url = urlparse(self.path)
+                table = url.path.rsplit("/", 1)[-1]
+                with server._lock:
+                    server.requests += 1
+                    server.per_table[table] = server.per_table.get(table, 0) + 1
+                if server.latency:
+                    time.sleep(server.latency)
+                return table, parse_qs(url.query)
+
+            def _body(self):
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"null")
+                return [payload] if isinstance(payload, dict) else payload
+
+            def _send(self, status, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                table, qs = self._request()
+                with server._lock:
+                    rows = server._filter(server.tables.get(table, []), qs)
+                    columns = qs.get("select", ["*"])[0]
+                    if columns != "*":
+                        names = [name.strip() for name in columns.split(",")]
+                        rows = [{name: row.get(name) for name in names} for row in rows]
+                    else:
+                        rows = [dict(row) for row in rows]
+                offset = int(qs.get("offset", ["0"])[0])
+                limit = qs.get("limit")
+                rows = rows[offset:offset + int(limit[0])] if limit else rows[offset:]
+                self._send(200, rows)
+
+            def do_POST(self):
+                table, qs = self._request()
+                rows = self._body()
+                merge = "merge-duplicates" in self.headers.get("Prefer", "")
+                keys = qs.get("on_conflict", ["id"])[0].split(",")
+                stored = []
+                with server._lock:
+                    for row in rows:
+                        existing = None
+                        if merge:
+                            existing = next((r for r in server.tables.get(table, [])
+                                             if all(r.get(key) == row.get(key) for key in keys)), None)
+                        if existing is not None:
+                            existing.update(row)
+                            stored.append(dict(existing))
+                        else:
+                            stored.append(dict(server._insert(table, {k: v for k, v in row.items() if k != "id" or v is not None})))
+                self._send(201, [] if "return=minimal" in self.headers.get("Prefer", "") else stored)
+
+            def do_PATCH(self):
+                table, qs = self._request()
+                changes = self._body()[0]
+                with server._lock:
+                    rows = server._filter(server.tables.get(table, []), qs)
+                    for row in rows:
+                        row.update(changes)
+                    updated = [dict(row) for row in rows]
+                self._send(200, updated)
+
+            def do_DELETE(self):
+                table, qs = self._request()
+                with server._lock:
+                    rows = server._filter(server.tables.get(table, []), qs)
+                    deleted = {id(row) for row in rows}
+                    server.tables[table] = [row for row in server.tables.get(table, []) if id(row) not in deleted]
+                self._send(200, [] if "return=minimal" in self.headers.get("Prefer", "") else rows)
+
+        return Handler
+
+def serve(handler):
+    """Arrancar un servidor HTTP en un puerto libre y devolver (servidor, URL base)"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
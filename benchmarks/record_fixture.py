@@ -0,0 +1,58 @@
+"""Grabar una temporada real de Jolpica como fixture para los benchmarks.
+
+Uso:
+    python benchmarks/record_fixture.py 2024
+"""
+import json
+import os
+import sys
+import time
+
+import requests
+
+from fakes import FIXTURES_DIR
+
+API_ROOT_URL = "https://api.jolpi.ca/ergast/f1"
+PAGE_LIMIT = 100
+
+def fetch_pages(url):
+    """Descargar todas las páginas de un endpoint respetando el límite de ráfaga de la API"""
+    offset = 0
+    while True:
+        response = requests.get(url, params={"limit": PAGE_LIMIT, "offset": offset}, timeout=30)
+        if response.status_code == 429:
+            time.sleep(int(response.headers.get("Retry-After", "5")))
+            continue
+        response.raise_for_status()
+        data = response.json()["MRData"]
+        yield data
+        offset += int(data["limit"])
+        if offset >= int(data["total"]):
+            return
+        time.sleep(0.3)
+
+def record_season(season):
+    base = f"{API_ROOT_URL}/{season}"
+    fixture = {
+        "season": season,
+        "races": [race for page in fetch_pages(f"{base}/races.json") for race in page["RaceTable"]["Races"]],
+        "drivers": [driver for page in fetch_pages(f"{base}/drivers.json") for driver in page["DriverTable"]["Drivers"]],
+        "constructors": [constructor for page in fetch_pages(f"{base}/constructors.json")
+                         for constructor in page["ConstructorTable"]["Constructors"]],
+    }
+    for endpoint, key in (("results", "Results"), ("sprint", "SprintResults"), ("qualifying", "QualifyingResults")):
+        by_round = {}
+        for page in fetch_pages(f"{base}/{endpoint}.json"):
+            for race in page["RaceTable"]["Races"]:
+                by_round.setdefault(race["round"], []).extend(race.get(key, []))
+        fixture[endpoint] = by_round
+
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    path = os.path.join(FIXTURES_DIR, f"{season}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(fixture, f)
+    print(f"Temporada {season} guardada en {path}.")
+
+if __name__ == "__main__":
+    for season in sys.argv[1:]:
+        record_season(int(season))
@@ -0,0 +1,203 @@
+"""Benchmarks de la sincronización contra Jolpica y Supabase locales.
+
+Ejemplos:
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py season incremental --latency-ms 50 --throttle-rate 0.05
+    python benchmarks/run_benchmarks.py --output bench.json --baseline bench_base.json
+    python benchmarks/run_benchmarks.py backfill --database-url postgresql://postgres@localhost/f1_bench
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+from fakes import FakeJolpica, FakePostgREST, load_season, serve
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SEASON = 2025
+BACKFILL_SEASONS = (2016, 2025)
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema.sql")
+TABLES = ("lap_data_loads", "lap_times", "pit_stops", "driver_statistics", "team_statistics", "calendar", "drivers", "teams")
+
+# Clave de servicio ficticia: el cliente de Supabase solo comprueba que tenga formato JWT
+FAKE_SERVICE_KEY = "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9.eyJyb2xlIjoic2VydmljZV9yb2xlIn0.benchmark"
+
+def reset_run_state(main, workdir, respect_limits):
+    """Dejar el módulo main como en un proceso nuevo, con caché y estado en ``workdir``"""
+    main.response_cache = main.ResponseCache(os.path.join(workdir, "jolpica"))
+    main.SYNC_STATE_PATH = os.path.join(workdir, "sync_state.json")
+    main.BACKFILL_CHECKPOINT_PATH = os.path.join(workdir, "backfill_checkpoint.json")
+    main.CHECKPOINT_DIR = os.path.join(workdir, "checkpoints")
+    main.mirror = main.LocalMirror(os.path.join(workdir, "mirror.sqlite3"))
+    main.id_resolver = main.IdResolver()
+    main.standings_service = main.StandingsService()
+    main.metrics = main.Metrics()
+    if respect_limits:
+        main.rate_limiter = main.RateLimiter(main.API_BURST_LIMIT, main.API_HOURLY_LIMIT)
+    else:
+        main.rate_limiter = main.RateLimiter(10_000, 10_000_000)
+
+def reset_postgres(database_url):
+    """Recrear las tablas vacías en un Postgres local, con el esquema actual de schema.sql"""
+    import psycopg
+    with psycopg.connect(database_url, autocommit=True) as conn:
+        conn.execute(f"DROP TABLE IF EXISTS {', '.join(TABLES)}")
+        with open(SCHEMA_PATH, encoding="utf-8") as f:
+            conn.execute(f.read())
+
+def scenario_season(main, jolpica, postgrest):
+    """Sincronización completa de una temporada de 24 rondas sobre una base vacía"""
+    main.update_database(SEASON, full=True)
+
+def scenario_backfill(main, jolpica, postgrest):
+    """Backfill de 10 temporadas sobre una base vacía"""
+    main.backfill(*BACKFILL_SEASONS)
+
+def setup_incremental(main, jolpica, postgrest):
+    jolpica.published[SEASON] = len(jolpica.seasons[SEASON]["races"]) - 1
+    main.update_database(SEASON)
+    jolpica.published.pop(SEASON)
+
+def scenario_incremental(main, jolpica, postgrest):
+    """Sincronización incremental tras publicarse una sola ronda nueva"""
+    main.update_database(SEASON)
+
+def scenario_fetchers(main, jolpica, postgrest):
+    """Las descargas de la sincronización por separado, con las tablas ya cargadas y sin escribir"""
+    races = main.fetch_races(SEASON)
+    main.fetch_drivers(SEASON)
+    main.fetch_teams(SEASON)
+    main.fetch_standings(SEASON)
+    # Los dos caminos de start_statistics: incremental por ronda y completo por temporada
+    with main.metrics.stage("round_results"):
+        main.collect_round_results(main.stream_round_races(SEASON, races), 1, len(races))
+    with main.metrics.stage("season_results"):
+        main.collect_round_results(main.stream_season_races(SEASON, races), 1, len(races))
+
+def scenario_laps(main, jolpica, postgrest):
+    """Carga de vueltas y paradas de una temporada ya sincronizada"""
+    main.update_lap_data(SEASON, main.fetch_races(SEASON))
+
+# nombre -> (preparación no medida, escenario medido)
+SCENARIOS = {
+    "season": (None, scenario_season),
+    "backfill": (None, scenario_backfill),
+    "incremental": (setup_incremental, scenario_incremental),
+    "fetchers": (scenario_season, scenario_fetchers),
+    "laps": (scenario_season, scenario_laps),
+}
+
+def run_scenario(name, main, jolpica, postgrest, respect_limits, database_url=None):
+    setup, scenario = SCENARIOS[name]
+    postgrest.tables.clear()
+    if database_url:
+        reset_postgres(database_url)
+    with tempfile.TemporaryDirectory() as workdir:
+        reset_run_state(main, workdir, respect_limits)
+        if setup:
+            setup(main, jolpica, postgrest)
+            main.id_resolver = main.IdResolver()
+            main.standings_service = main.StandingsService()
+            main.metrics = main.Metrics()
+
+        http_before, throttled_before = jolpica.requests, jolpica.throttled
+        db_before, tables_before = postgrest.requests, dict(postgrest.per_table)
+        start = time.perf_counter()
+        scenario(main, jolpica, postgrest)
+        wall = time.perf_counter() - start
+
+    report = main.metrics.report()
+    return {
+        "wall_seconds": round(wall, 3),
+        "http_requests": jolpica.requests - http_before,
+        "http_throttled": jolpica.throttled - throttled_before,
+        "db_round_trips": report["totals"]["db_queries"] if database_url else postgrest.requests - db_before,
+        "db_rows_per_second": round(report["totals"]["db_rows_per_second"]),
+        "db_by_table": {table: count - tables_before.get(table, 0)
+                        for table, count in postgrest.per_table.items()
+                        if count - tables_before.get(table, 0)},
+        "stages": {stage: round(entry["seconds"], 3) for stage, entry in report["stages"].items()},
+        "functions": {name: {"calls": entry["calls"], "seconds": round(entry["seconds"], 3)}
+                      for name, entry in report["functions"].items()},
+    }
+
+def compare_with_baseline(results, baseline, tolerance):
+    """Devolver las regresiones en número de peticiones respecto a una ejecución anterior"""
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        for field in ("http_requests", "db_round_trips"):
+            if result[field] > previous[field] * (1 + tolerance):
+                regressions.append(f"{name}.{field}: {previous[field]} -> {result[field]}")
+    return regressions
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Benchmarks offline de main.py")
+    parser.add_argument("scenarios", nargs="*", metavar="scenario",
+                        help=f"escenarios a ejecutar: {', '.join(SCENARIOS)} (por defecto todos)")
+    parser.add_argument("--rounds", type=int, default=24, help="rondas de las temporadas sintéticas")
+    parser.add_argument("--latency-ms", type=float, default=0, help="latencia añadida por petición a Jolpica")
+    parser.add_argument("--db-latency-ms", type=float, default=0, help="latencia añadida por petición a PostgREST")
+    parser.add_argument("--throttle-rate", type=float, default=0, help="fracción de peticiones que reciben un 429")
+    parser.add_argument("--retry-after", default="0", help="cabecera Retry-After de los 429 inyectados")
+    parser.add_argument("--respect-limits", action="store_true",
+                        help="usar los límites reales de Jolpica en el limitador")
+    parser.add_argument("--database-url",
+                        help="escribir con el backend postgres en esta base local en lugar de PostgREST")
+    parser.add_argument("--output", help="guardar los resultados en JSON")
+    parser.add_argument("--baseline", help="JSON de una ejecución anterior para detectar regresiones")
+    parser.add_argument("--tolerance", type=float, default=0.0,
+                        help="aumento relativo de peticiones permitido frente al baseline")
+    args = parser.parse_args()
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"escenarios desconocidos: {', '.join(unknown)}")
+
+    seasons = {season: load_season(season, rounds=args.rounds)
+               for season in range(BACKFILL_SEASONS[0], BACKFILL_SEASONS[1] + 1)}
+    jolpica = FakeJolpica(seasons, throttle_rate=args.throttle_rate,
+                          latency=args.latency_ms / 1000, retry_after=args.retry_after)
+    postgrest = FakePostgREST(latency=args.db_latency_ms / 1000)
+    _, jolpica_url = serve(jolpica.handler())
+    _, postgrest_url = serve(postgrest.handler())
+
+    # main.py lee la configuración al importarse
+    os.environ["JOLPICA_API_URL"] = f"{jolpica_url}/ergast/f1"
+    os.environ["SUPABASE_URL"] = postgrest_url
+    os.environ["SUPABASE_SERVICE_KEY"] = FAKE_SERVICE_KEY
+    if args.database_url:
+        os.environ["F1_STORAGE_BACKEND"] = "postgres"
+        os.environ["DATABASE_URL"] = args.database_url
+    sys.path.insert(0, ROOT_DIR)
+    import main
+
+    results = {}
+    for name in args.scenarios or list(SCENARIOS):
+        results[name] = run_scenario(name, main, jolpica, postgrest, args.respect_limits, args.database_url)
+
+    print()
+    print(f"{'escenario':<12} {'tiempo (s)':>10} {'HTTP':>6} {'429':>5} {'BD':>6} {'filas/s':>9}")
+    for name, result in results.items():
+        print(f"{name:<12} {result['wall_seconds']:>10.3f} {result['http_requests']:>6} "
+              f"{result['http_throttled']:>5} {result['db_round_trips']:>6} {result['db_rows_per_second']:>9}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Resultados guardados en {args.output}.")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare_with_baseline(results, json.load(f), args.tolerance)
+        if regressions:
+            print("Regresiones detectadas:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,110 @@
+-- Tablas que escribe main.py, para probar el backend postgres contra un Postgres local:
+--   psql "$DATABASE_URL" -f benchmarks/schema.sql
+-- Los cambios sobre una base existente van en supabase/migrations.
+
+CREATE TABLE IF NOT EXISTS calendar (
+    id bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    race_name text NOT NULL,
+    circuit_name text,
+    circuit_location text,
+    circuit_country text,
+    race_date timestamp,
+    fp1_time timestamptz,
+    fp2_time timestamptz,
+    fp3_time timestamptz,
+    qualifying_time timestamptz,
+    race_time timestamptz,
+    sprint_qualifying_time timestamptz,
+    sprint_race_time timestamptz,
+    season_year integer NOT NULL,
+    updated_at timestamptz,
+    UNIQUE (race_name, season_year)
+);
+
+CREATE TABLE IF NOT EXISTS drivers (
+    id bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    driver_ref text UNIQUE,
+    driver_code text NOT NULL,
+    first_name text,
+    last_name text,
+    nationality text,
+    updated_at timestamptz
+);
+
+CREATE TABLE IF NOT EXISTS teams (
+    id bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    team_name text NOT NULL UNIQUE,
+    nationality text,
+    updated_at timestamptz
+);
+
+CREATE TABLE IF NOT EXISTS driver_statistics (
+    id bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    driver_id bigint NOT NULL REFERENCES drivers (id),
+    race_id bigint REFERENCES calendar (id),
+    season_year integer NOT NULL,
+    race_wins integer,
+    sprint_wins integer,
+    podiums integer,
+    poles integer,
+    total_points double precision,
+    fastest_laps integer,
+    position integer,
+    updated_at timestamptz,
+    UNIQUE NULLS NOT DISTINCT (driver_id, season_year, race_id)
+);
+-- Series por ronda (race_id no nulo) para las gráficas de evolución
+CREATE INDEX IF NOT EXISTS driver_statistics_season_race_idx ON driver_statistics (season_year, race_id);
+
+CREATE TABLE IF NOT EXISTS team_statistics (
+    id bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    team_id bigint NOT NULL REFERENCES teams (id),
+    race_id bigint REFERENCES calendar (id),
+    season_year integer NOT NULL,
+    race_wins integer,
+    sprint_wins integer,
+    podiums integer,
+    total_points double precision,
+    fastest_laps integer,
+    position integer,
+    updated_at timestamptz,
+    UNIQUE NULLS NOT DISTINCT (team_id, season_year, race_id)
+);
+CREATE INDEX IF NOT EXISTS team_statistics_season_race_idx ON team_statistics (season_year, race_id);
+
+CREATE TABLE IF NOT EXISTS lap_times (
+    id bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    race_id bigint NOT NULL REFERENCES calendar (id),
+    driver_id bigint NOT NULL REFERENCES drivers (id),
+    season_year integer NOT NULL,
+    lap_number integer NOT NULL,
+    position integer,
+    lap_time text,
+    milliseconds integer,
+    updated_at timestamptz DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS lap_times_race_id_idx ON lap_times (race_id);
+
+CREATE TABLE IF NOT EXISTS pit_stops (
+    id bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    race_id bigint NOT NULL REFERENCES calendar (id),
+    driver_id bigint NOT NULL REFERENCES drivers (id),
+    season_year integer NOT NULL,
+    stop_number integer NOT NULL,
+    lap_number integer NOT NULL,
+    time_of_day text,
+    duration text,
+    milliseconds integer,
+    updated_at timestamptz DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS pit_stops_race_id_idx ON pit_stops (race_id);
+
+CREATE TABLE IF NOT EXISTS lap_data_loads (
+    race_id bigint NOT NULL REFERENCES calendar (id),
+    season_year integer NOT NULL,
+    dataset text NOT NULL,
+    row_count integer NOT NULL,
+    updated_at timestamptz DEFAULT now(),
+    PRIMARY KEY (race_id, dataset)
+);
+CREATE INDEX IF NOT EXISTS lap_data_loads_season_idx ON lap_data_loads (season_year);
@@ -1,581 +1,2687 @@
+import argparse
+import copy
+import cProfile
+import functools
+import hashlib
+import json
 import os
+import pstats
+import queue
+import random
 import requests
 import sys
-from supabase import create_client, Client
-from datetime import datetime, UTC
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from dataclasses import dataclass
+from operator import itemgetter
+from datetime import datetime, timedelta, UTC
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 
-# Cargar variables de entorno desde .env
-load_dotenv()
+try:
+    import orjson
+except ImportError:  # Opcional: sin orjson se usa el módulo json estándar
+    orjson = None
 
-# Configuración de Supabase
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# NumPy solo se importa si se elige el motor de agregación numpy (ver import_numpy)
+np = None
 
-# URL base de la API Jolpica F1
-API_BASE_URL = "http://api.jolpi.ca/ergast/f1/2025"
+# Como script, .env se carga antes de leer la configuración; al importar el módulo
+# no se toca el entorno hasta el primer acceso a la base de datos
+if __name__ == "__main__":
+    load_dotenv()
 
-def fetch_races():
-    """Obtener el calendario de carreras de 2025, incluyendo datos de sprint"""
-    try:
-        response = requests.get(f"{API_BASE_URL}/races.json")
+# Cliente de Supabase, creado en el primer uso (ver get_supabase): importar este
+# módulo no necesita credenciales ni red
+supabase = None
+supabase_lock = threading.Lock()
+
+def get_supabase():
+    """Cliente de Supabase, creado la primera vez con SUPABASE_URL y SUPABASE_SERVICE_KEY"""
+    global supabase
+    if supabase is None:
+        with supabase_lock:
+            if supabase is None:
+                from supabase import ClientOptions, create_client  # Importación lenta: solo si se usa la API REST
+                load_dotenv()
+                supabase = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_SERVICE_KEY"),
+                                         options=ClientOptions(postgrest_client_timeout=DB_REQUEST_TIMEOUT))
+    return supabase
+
+# URL base de la API Jolpica F1 y temporada por defecto
+API_ROOT_URL = os.getenv("JOLPICA_API_URL", "http://api.jolpi.ca/ergast/f1")
+DEFAULT_SEASON = int(os.getenv("F1_SEASON", "2025"))
+
+def season_url(season):
+    """URL base de los endpoints de una temporada"""
+    return f"{API_ROOT_URL}/{season}"
+
+def driver_code_of(driver):
+    """Código del piloto; los pilotos históricos sin código usan su driverId"""
+    return driver.get("code") or driver["driverId"]
+
+def decode_json(response):
+    """Decodificar una sola vez el cuerpo JSON de una respuesta, con orjson si está instalado"""
+    return orjson.loads(response.content) if orjson else json.loads(response.content)
+
+# Registros tipados de la API: cada respuesta se decodifica una vez y se convierte
+# a estos registros, que validan la forma de los datos en un único sitio
+
+@dataclass(slots=True, frozen=True)
+class Session:
+    date: str
+    time: str
+
+    @classmethod
+    def from_api(cls, data):
+        """Sesión de un fin de semana, o None si la API no trae su fecha"""
+        if not data or not data.get("date"):
+            return None
+        return cls(data["date"], data.get("time", "00:00:00Z"))
+
+    @property
+    def iso(self):
+        return f"{self.date}T{self.time}"
+
+# Columna de calendar -> clave de la sesión en la API
+CALENDAR_SESSIONS = (
+    ("fp1_time", "FirstPractice"),
+    ("fp2_time", "SecondPractice"),
+    ("fp3_time", "ThirdPractice"),
+    ("qualifying_time", "Qualifying"),
+    ("sprint_qualifying_time", "SprintQualifying"),
+    ("sprint_race_time", "Sprint"),
+)
+
+@dataclass(slots=True, frozen=True)
+class Race:
+    season: int
+    round: int
+    name: str
+    circuit_name: str
+    circuit_location: str
+    circuit_country: str
+    race: Session
+    sessions: dict
+
+    @classmethod
+    def from_api(cls, data):
+        circuit = data["Circuit"]
+        return cls(
+            season=int(data["season"]),
+            round=int(data["round"]),
+            name=data.get("raceName") or "Unknown Race",
+            circuit_name=circuit["circuitName"],
+            circuit_location=circuit["Location"]["locality"],
+            circuit_country=circuit["Location"]["country"],
+            race=Session(data["date"], data.get("time", "00:00:00Z")),
+            sessions={column: Session.from_api(data.get(key)) for column, key in CALENDAR_SESSIONS},
+        )
+
+    def to_row(self):
+        """Fila de la tabla calendar"""
+        return {
+            "race_name": self.name,
+            "circuit_name": self.circuit_name,
+            "circuit_location": self.circuit_location,
+            "circuit_country": self.circuit_country,
+            "race_date": datetime.strptime(self.race.date, "%Y-%m-%d").isoformat(),
+            "fp1_time": self._session_time("fp1_time"),
+            "fp2_time": self._session_time("fp2_time"),
+            "fp3_time": self._session_time("fp3_time"),
+            "qualifying_time": self._session_time("qualifying_time"),
+            "race_time": self.race.iso,
+            "sprint_qualifying_time": self._session_time("sprint_qualifying_time"),
+            "sprint_race_time": self._session_time("sprint_race_time"),
+            "season_year": self.season
+        }
+
+    def _session_time(self, column):
+        session = self.sessions[column]
+        return session.iso if session else None
+
+@dataclass(slots=True, frozen=True)
+class Driver:
+    driver_id: str
+    code: str
+    first_name: str
+    last_name: str
+    nationality: str
+
+    @classmethod
+    def from_api(cls, data):
+        return cls(data["driverId"], driver_code_of(data), data.get("givenName"),
+                   data.get("familyName"), data.get("nationality"))
+
+    def to_row(self):
+        """Fila de la tabla drivers"""
+        return {
+            "driver_ref": self.driver_id,
+            "driver_code": self.code,
+            "first_name": self.first_name,
+            "last_name": self.last_name,
+            "nationality": self.nationality
+        }
+
+@dataclass(slots=True, frozen=True)
+class Constructor:
+    constructor_id: str
+    name: str
+    nationality: str
+
+    @classmethod
+    def from_api(cls, data):
+        return cls(data.get("constructorId"), data["name"], data.get("nationality"))
+
+    def to_row(self):
+        """Fila de la tabla teams"""
+        return {
+            "team_name": self.name,
+            "nationality": self.nationality
+        }
+
+@dataclass(slots=True, frozen=True)
+class Result:
+    """Resultado de un piloto en carrera, sprint o clasificación"""
+    driver: Driver
+    constructor: Constructor
+    position: int
+    points: float
+    fastest_lap: bool
+
+    @classmethod
+    def from_api(cls, data):
+        constructor = data.get("Constructor")
+        return cls(
+            driver=Driver.from_api(data["Driver"]),
+            constructor=Constructor.from_api(constructor) if constructor else None,
+            position=int(data.get("position", 0)),
+            points=float(data.get("points", 0)),
+            fastest_lap=data.get("FastestLap", {}).get("rank") == "1",
+        )
+
+@dataclass(slots=True, frozen=True)
+class Standing:
+    """Posición de un piloto o equipo en la clasificación; ``position`` es None si no está definida"""
+    driver: Driver
+    constructor: Constructor
+    position: int
+    points: float
+
+    @classmethod
+    def from_api(cls, data):
+        driver = data.get("Driver")
+        constructor = data.get("Constructor")
+        return cls(
+            driver=Driver.from_api(driver) if driver else None,
+            constructor=Constructor.from_api(constructor) if constructor else None,
+            position=None if data.get("positionText") == "-" else int(data.get("position", 0)),
+            points=float(data.get("points", 0)),
+        )
+
+class Metrics:
+    """Métricas de una ejecución: tiempos por etapa y función, peticiones HTTP y consultas a Supabase"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = datetime.now(UTC)
+        self._started = time.perf_counter()
+        self.stages = {}
+        self.functions = {}
+        self.http = {}
+        self.db = {}
+        self.profile_stage = None
+
+    def _add(self, group, name, **values):
+        with self._lock:
+            entry = group.setdefault(name, {})
+            for field, value in values.items():
+                entry[field] = entry.get(field, 0) + value
+
+    @contextmanager
+    def stage(self, name):
+        """Medir una etapa; si coincide con ``profile_stage`` se perfila con cProfile"""
+        profiler = cProfile.Profile() if name == self.profile_stage else None
+        if profiler:
+            profiler.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._add(self.stages, name, calls=1, seconds=time.perf_counter() - start)
+            if profiler:
+                profiler.disable()
+                profiler.dump_stats(f"profile-{name}.prof")
+                pstats.Stats(profiler).sort_stats("cumulative").print_stats(25)
+
+    def record_call(self, name, seconds):
+        self._add(self.functions, name, calls=1, seconds=seconds)
+
+    def record_http(self, endpoint, **values):
+        self._add(self.http, endpoint, **values)
+
+    def record_db(self, table, operation, seconds, rows=0):
+        values = {"queries": 1, "seconds": seconds, "rows": rows, operation: 1}
+        if operation != "select":
+            values.update(rows_written=rows, write_seconds=seconds)
+        self._add(self.db, table, **values)
+
+    def report(self):
+        with self._lock:
+            totals = {
+                "requests": sum(entry.get("requests", 0) for entry in self.http.values()),
+                "bytes_received": sum(entry.get("bytes", 0) for entry in self.http.values()),
+                "retries": sum(entry.get("retries", 0) for entry in self.http.values()),
+                "throttled": sum(entry.get("throttled", 0) for entry in self.http.values()),
+                "db_queries": sum(entry.get("queries", 0) for entry in self.db.values()),
+                "db_rows_written": sum(entry.get("rows_written", 0) for entry in self.db.values()),
+            }
+            write_seconds = sum(entry.get("write_seconds", 0) for entry in self.db.values())
+            totals["db_rows_per_second"] = totals["db_rows_written"] / write_seconds if write_seconds else 0
+            db = copy.deepcopy(self.db)
+            for entry in db.values():
+                if entry.get("write_seconds"):
+                    entry["rows_per_second"] = entry["rows_written"] / entry["write_seconds"]
+            return {
+                "started_at": self.started_at.isoformat(),
+                "wall_seconds": time.perf_counter() - self._started,
+                "totals": totals,
+                "stages": copy.deepcopy(self.stages),
+                "functions": copy.deepcopy(self.functions),
+                "http": copy.deepcopy(self.http),
+                "db": db,
+            }
+
+    def write(self, path):
+        """Guardar el informe en JSON"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=2)
+        print(f"Métricas guardadas en {path}.")
+
+metrics = Metrics()
+
+def timed(func):
+    """Registrar en las métricas las llamadas y el tiempo de una función"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            metrics.record_call(func.__name__, time.perf_counter() - start)
+    return wrapper
+
+# Límites publicados por Jolpica: ráfaga de 4 peticiones/s y 500 peticiones/hora
+API_BURST_LIMIT = 4
+API_HOURLY_LIMIT = 500
+
+# Número de peticiones simultáneas al descargar resultados por ronda (1 = secuencial)
+FETCH_WORKERS = int(os.getenv("FETCH_WORKERS", "4"))
+
+class RateLimiter:
+    """Token bucket compartido entre hilos con un límite por segundo y otro por hora"""
+
+    def __init__(self, per_second, per_hour):
+        self.per_second = per_second
+        self.per_hour = per_hour
+        self._lock = threading.Lock()
+        self._tokens = float(per_second)
+        self._hour_tokens = float(per_hour)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    def pause(self, seconds):
+        """Retener todas las peticiones durante ``seconds`` (p. ej. tras un 429)"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def acquire(self):
+        """Bloquear hasta que haya una ficha disponible en ambos cubos"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                elapsed = now - self._updated
+                self._updated = now
+                self._tokens = min(self.per_second, self._tokens + elapsed * self.per_second)
+                self._hour_tokens = min(self.per_hour, self._hour_tokens + elapsed * self.per_hour / 3600)
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                elif self._tokens >= 1 and self._hour_tokens >= 1:
+                    self._tokens -= 1
+                    self._hour_tokens -= 1
+                    return
+                else:
+                    wait = max((1 - self._tokens) / self.per_second,
+                               (1 - self._hour_tokens) * 3600 / self.per_hour)
+            time.sleep(wait)
+
+rate_limiter = RateLimiter(API_BURST_LIMIT, API_HOURLY_LIMIT)
+
+# Reintentos ante 429/5xx: backoff exponencial con jitter, respetando Retry-After
+API_MAX_RETRIES = 6
+API_BACKOFF_BASE = 1.0
+API_BACKOFF_MAX = 120.0
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Timeouts (conexión, lectura) en segundos por endpoint
+API_TIMEOUTS = {
+    "races": (5, 20),
+    "drivers": (5, 15),
+    "constructors": (5, 15),
+    "results": (5, 30),
+    "sprint": (5, 30),
+    "qualifying": (5, 30),
+    "driverStandings": (5, 20),
+    "constructorStandings": (5, 20),
+}
+DEFAULT_API_TIMEOUT = (5, 30)
+
+class RateLimitExceeded(Exception):
+    """La API siguió respondiendo 429 después de agotar los reintentos"""
+
+# Sesión HTTP compartida: reutiliza conexiones keep-alive entre peticiones e hilos
+http_session = requests.Session()
+http_session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=max(10, FETCH_WORKERS)))
+http_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=max(10, FETCH_WORKERS)))
+
+def endpoint_name(url):
+    """Nombre del endpoint de una URL (p. ej. .../5/results.json -> results)"""
+    return url.split("?", 1)[0].rsplit("/", 1)[-1].removesuffix(".json")
+
+def endpoint_timeout(url):
+    """Timeout configurado para el endpoint de una URL"""
+    return API_TIMEOUTS.get(endpoint_name(url), DEFAULT_API_TIMEOUT)
+
+def retry_delay(attempt, response=None):
+    """Espera antes del siguiente intento: Retry-After si existe, si no backoff con jitter"""
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after:
+        try:
+            return min(API_BACKOFF_MAX, max(0.0, float(retry_after)))
+        except ValueError:
+            try:
+                return min(API_BACKOFF_MAX, max(0.0, (parsedate_to_datetime(retry_after) - datetime.now(UTC)).total_seconds()))
+            except (TypeError, ValueError):
+                pass
+    return random.uniform(0, min(API_BACKOFF_MAX, API_BACKOFF_BASE * 2 ** attempt))
+
+def http_get(url, headers=None):
+    """GET a la API de Jolpica con limitador compartido, timeouts y reintentos"""
+    endpoint = endpoint_name(url)
+    timeout = endpoint_timeout(url)
+    for attempt in range(API_MAX_RETRIES + 1):
+        rate_limiter.acquire()
+        start = time.perf_counter()
+        try:
+            response = http_session.get(url, headers=headers, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            metrics.record_http(endpoint, requests=1, errors=1, seconds=time.perf_counter() - start,
+                                retries=1 if attempt else 0)
+            if attempt == API_MAX_RETRIES:
+                raise
+            delay = retry_delay(attempt)
+            print(f"Error de red en {url} ({e}). Reintentando en {delay:.1f}s...")
+            time.sleep(delay)
+            continue
+
+        metrics.record_http(endpoint, requests=1, bytes=len(response.content),
+                            seconds=time.perf_counter() - start, retries=1 if attempt else 0,
+                            throttled=1 if response.status_code == 429 else 0,
+                            not_modified=1 if response.status_code == 304 else 0)
+        if response.status_code not in RETRY_STATUS_CODES:
+            return response
+        if attempt == API_MAX_RETRIES:
+            break
+        delay = retry_delay(attempt, response)
         if response.status_code == 429:
-            print("Error 429: Too Many Requests al obtener carreras.")
-            sys.exit(429)
+            # Pausar también al resto de hilos para no seguir provocando 429
+            rate_limiter.pause(delay)
+        print(f"Error {response.status_code} en {url}. Reintentando en {delay:.1f}s...")
+        time.sleep(delay)
+
+    if response.status_code == 429:
+        raise RateLimitExceeded(f"Too Many Requests en {url} tras {API_MAX_RETRIES} reintentos")
+    return response
+
+# Caché en disco de respuestas de Jolpica; el workflow persiste el directorio entre ejecuciones
+CACHE_DIR = os.getenv("F1_CACHE_DIR", ".cache/jolpica")
+# Las rondas disputadas hace más de estos días se consideran inmutables y no se revalidan
+CACHE_IMMUTABLE_AFTER_DAYS = int(os.getenv("CACHE_IMMUTABLE_AFTER_DAYS", "3"))
+
+class ResponseCache:
+    """Caché de respuestas 200 indexada por URL, con ETag/Last-Modified para revalidar"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, url):
+        return os.path.join(self.directory, hashlib.sha256(url.encode()).hexdigest() + ".json")
+
+    def get(self, url):
+        try:
+            with open(self._path(url), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, url, response, immutable=False):
+        """Guardar una respuesta; ``immutable`` indica que se pidió con los datos ya asentados"""
+        self.write(url, {
+            "url": url,
+            "body": response.text,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "fetched_at": datetime.now(UTC).isoformat(),
+            "immutable": immutable
+        })
+
+    def write(self, url, entry):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._path(url)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"No se pudo guardar en caché {url}: {e}")
+
+    @staticmethod
+    def to_response(url, entry):
+        """Reconstruir una respuesta 200 a partir de una entrada de la caché"""
+        response = requests.Response()
+        response.status_code = 200
+        response.url = url
+        response.encoding = "utf-8"
+        response._content = entry["body"].encode("utf-8")
+        response.headers["X-Cache"] = "HIT"
+        return response
+
+response_cache = ResponseCache(CACHE_DIR)
+
+# Estado de la sincronización incremental, junto a la caché para persistirlo entre ejecuciones
+SYNC_STATE_PATH = os.getenv("F1_SYNC_STATE", ".cache/sync_state.json")
+
+def round_is_settled(race):
+    """Una ronda se considera inmutable cuando han pasado CACHE_IMMUTABLE_AFTER_DAYS desde la carrera"""
+    race_date = datetime.fromisoformat(race["race_date"]).replace(tzinfo=UTC)
+    return datetime.now(UTC) - race_date > timedelta(days=CACHE_IMMUTABLE_AFTER_DAYS)
+
+def api_get(url, immutable=False):
+    """GET con caché en disco.
+
+    Con ``immutable`` una entrada cacheada se devuelve sin tocar la red si también
+    se guardó con los datos ya asentados; una guardada antes (por ejemplo con la
+    temporada a medias) se revalida una vez. En otro caso se revalida con
+    If-None-Match/If-Modified-Since y un 304 reutiliza el cuerpo guardado.
+    """
+    entry = response_cache.get(url)
+    if entry is not None and immutable and entry.get("immutable"):
+        metrics.record_http(endpoint_name(url), cache_hits=1)
+        return ResponseCache.to_response(url, entry)
+
+    headers = {}
+    if entry is not None:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    response = http_get(url, headers=headers or None)
+    if response.status_code == 304 and entry is not None:
+        if immutable:
+            response_cache.write(url, {**entry, "immutable": True})
+        return ResponseCache.to_response(url, entry)
+    if response.status_code == 200:
+        response_cache.put(url, response, immutable=immutable)
+    return response
+
+# Tamaño de página para lecturas completas (PostgREST limita a 1000 filas por defecto)
+SELECT_PAGE_SIZE = 1000
+
+def db_execute(table, operation, query, rows=None):
+    """Ejecutar una consulta de Supabase registrando su tiempo en las métricas.
+
+    ``rows`` indica las filas escritas cuando la respuesta no las devuelve.
+    """
+    start = time.perf_counter()
+    response = None
+    try:
+        response = query.execute()
+        return response
+    finally:
+        if rows is None:
+            rows = len(response.data) if response is not None and response.data else 0
+        metrics.record_db(table, operation, time.perf_counter() - start, rows=rows)
+
+def select_all(table, columns, **filters):
+    """Leer todas las filas de una tabla con el backend de almacenamiento configurado"""
+    return get_storage().select_all(table, columns, **filters)
+
+class IdResolver:
+    """Mapas de IDs de drivers, teams y calendar cargados una vez por ejecución.
+
+    Las claves son driver_ref (el driverId de la API), team_name y
+    (race_name, season_year). Si se pide
+    una clave desconocida se recarga la tabla correspondiente una sola vez por
+    clave, de modo que las filas insertadas durante la ejecución se resuelven
+    sin volver a consultar Supabase fila por fila.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._maps = {}
+        self._misses = {}
+
+    def _load(self, table):
+        if table == "drivers":
+            rows = select_all("drivers", "id, driver_ref")
+            mapping = {row["driver_ref"]: row["id"] for row in rows if row["driver_ref"] is not None}
+        elif table == "teams":
+            rows = select_all("teams", "id, team_name")
+            mapping = {row["team_name"]: row["id"] for row in rows}
+        else:
+            rows = select_all("calendar", "id, race_name, season_year")
+            mapping = {(row["race_name"], row["season_year"]): row["id"] for row in rows}
+        self._maps[table] = mapping
+        self._misses[table] = set()
+
+    def _lookup(self, table, key):
+        with self._lock:
+            if table not in self._maps:
+                self._load(table)
+            if key not in self._maps[table] and key not in self._misses[table]:
+                self._load(table)
+                if key not in self._maps[table]:
+                    self._misses[table].add(key)
+            return self._maps[table].get(key)
+
+    def invalidate(self, table=None):
+        """Descartar los mapas cargados para forzar una recarga en el próximo uso"""
+        with self._lock:
+            if table is None:
+                self._maps.clear()
+                self._misses.clear()
+            else:
+                self._maps.pop(table, None)
+                self._misses.pop(table, None)
+
+    def driver_id(self, driver_ref):
+        return self._lookup("drivers", driver_ref)
+
+    def team_id(self, team_name):
+        return self._lookup("teams", team_name)
+
+    def race_id(self, race_name, season_year):
+        return self._lookup("calendar", (race_name, season_year))
+
+id_resolver = IdResolver()
+
+# Tamaño de lote para escrituras masivas (filas por petición)
+UPSERT_BATCH_SIZE = int(os.getenv("UPSERT_BATCH_SIZE", "500"))
+
+# Claves naturales de cada tabla escrita por el script. Los pilotos se identifican por
+# el driverId de la API: los códigos se reutilizan entre épocas (MSC es Michael y Mick)
+NATURAL_KEYS = {
+    "calendar": ("race_name", "season_year"),
+    "drivers": ("driver_ref",),
+    "teams": ("team_name",),
+}
+STATISTICS_KEYS = {
+    "driver_statistics": ("driver_id", "season_year", "race_id"),
+    "team_statistics": ("team_id", "season_year", "race_id"),
+}
+
+def parse_timestamp(value):
+    """Interpretar una fecha ISO (con o sin zona) como datetime en UTC, o None si no lo es"""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=UTC)
+
+def values_equal(new, stored):
+    """Comparar un valor calculado con el almacenado, tolerando formatos de fecha distintos"""
+    if new == stored:
+        return True
+    if isinstance(new, str) and isinstance(stored, str):
+        new_ts, stored_ts = parse_timestamp(new), parse_timestamp(stored)
+        return new_ts is not None and new_ts == stored_ts
+    return False
+
+def upsert_rows(table, rows, key_columns, batch_size=UPSERT_BATCH_SIZE, insert_missing=True, **filters):
+    """Insertar o actualizar en bloque con el backend configurado; devuelve (insertadas, actualizadas, sin cambios).
+
+    Con ``insert_missing=False`` solo se actualizan filas existentes y las demás se ignoran.
+    """
+    return get_storage().upsert_rows(table, rows, key_columns, batch_size=batch_size,
+                                     insert_missing=insert_missing, **filters)
+
+# Escrituras simultáneas como máximo en todo el proceso: cada una ocupa una conexión de
+# PostgREST o de Postgres, así que el límite se comparte también entre temporadas del backfill
+WRITE_CONCURRENCY = int(os.getenv("F1_WRITE_CONCURRENCY", "4"))
+# Tiempo máximo de cada petición a la base de datos, en segundos
+DB_REQUEST_TIMEOUT = float(os.getenv("F1_DB_TIMEOUT", "60"))
+
+class WriteErrors(Exception):
+    """Fallos de varias escrituras en paralelo; ``errors`` tiene pares (etiqueta, excepción)"""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(f"{len(errors)} escrituras fallidas: "
+                         + "; ".join(f"{label}: {error}" for label, error in errors))
+
+# Hilos de escritura compartidos: viven toda la ejecución para reutilizar sus conexiones
+write_pool = None
+write_pool_lock = threading.Lock()
+write_thread = threading.local()
+
+def get_write_pool():
+    global write_pool
+    with write_pool_lock:
+        if write_pool is None:
+            write_pool = ThreadPoolExecutor(max_workers=max(1, WRITE_CONCURRENCY), thread_name_prefix="write",
+                                            initializer=lambda: setattr(write_thread, "active", True))
+        return write_pool
+
+class ParallelWriter:
+    """Lanzar escrituras en paralelo sobre los hilos de escritura, con ``concurrency`` como máximo en curso.
+
+    submit() bloquea mientras el cupo está lleno, así que un productor que genera
+    lotes sobre la marcha no acumula más de ``concurrency`` en memoria. Un fallo no
+    detiene las demás escrituras: al salir del bloque ``with`` se espera a todas y
+    se lanza el error si hubo uno solo o un WriteErrors con todos si hubo varios.
+    RateLimitExceeded se relanza tal cual para que la ejecución termine con 429.
+
+    Dentro de un hilo de escritura las escrituras anidadas se ejecutan en orden en
+    ese mismo hilo: el paralelismo ya lo aporta el nivel superior y así no se
+    supera el límite ni se espera a tareas encoladas detrás de la propia.
+    """
+
+    def __init__(self, concurrency=WRITE_CONCURRENCY):
+        self.inline = concurrency <= 1 or getattr(write_thread, "active", False)
+        self.errors = []
+        self._slots = threading.BoundedSemaphore(max(1, concurrency))
+        self._lock = threading.Lock()
+        self._futures = []
+
+    def __enter__(self):
+        return self
+
+    def _run(self, label, func, args, kwargs):
+        try:
+            func(*args, **kwargs)
+        except Exception as e:
+            with self._lock:
+                self.errors.append((label, e))
+
+    def _run_slot(self, label, func, args, kwargs):
+        try:
+            self._run(label, func, args, kwargs)
+        finally:
+            self._slots.release()
+
+    def submit(self, label, func, *args, **kwargs):
+        """Encolar ``func(*args, **kwargs)``; ``label`` identifica la escritura en los errores"""
+        if self.inline:
+            self._run(label, func, args, kwargs)
+            return
+        self._slots.acquire()
+        try:
+            self._futures.append(get_write_pool().submit(self._run_slot, label, func, args, kwargs))
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def __exit__(self, exc_type, exc, tb):
+        for future in self._futures:
+            future.result()
+        if exc_type is not None:
+            for label, error in self.errors:
+                print(f"Error en la escritura {label}: {error}")
+            return False
+        if not self.errors:
+            return False
+        for _, error in self.errors:
+            if isinstance(error, RateLimitExceeded):
+                raise error
+        if len(self.errors) == 1:
+            raise self.errors[0][1]
+        raise WriteErrors(self.errors)
+
+class RestBackend:
+    """Lecturas y escrituras a través de la API REST de Supabase (PostgREST)"""
+
+    name = "rest"
+
+    def select_all(self, table, columns, **filters):
+        """Leer todas las filas de una tabla paginando con range()"""
+        rows = []
+        offset = 0
+        while True:
+            query = get_supabase().table(table).select(columns)
+            for column, value in filters.items():
+                query = query.eq(column, value)
+            page = db_execute(table, "select", query.range(offset, offset + SELECT_PAGE_SIZE - 1)).data
+            rows.extend(page)
+            if len(page) < SELECT_PAGE_SIZE:
+                return rows
+            offset += SELECT_PAGE_SIZE
+
+    def upsert_rows(self, table, rows, key_columns, batch_size=UPSERT_BATCH_SIZE, insert_missing=True, **filters):
+        """Insertar o actualizar en bloque solo las filas nuevas o con contenido distinto.
+
+        Lee una sola vez las filas existentes (acotadas por ``filters``) y las compara
+        columna a columna con las calculadas. Las iguales no se envían; las que cambian
+        se actualizan con un upsert sobre ``id`` y las nuevas se insertan, ambas en
+        lotes y con ``updated_at`` renovado. La coincidencia de claves se hace aquí y
+        no con ``on_conflict`` porque ``race_id`` es nulo en las filas de temporada y
+        Postgres no considera iguales dos claves con NULL.
+        Devuelve una tupla (insertadas, actualizadas, sin cambios).
+        """
+        # Deduplicar por clave: la última fila gana, como con el bucle original
+        pending = {tuple(row[column] for column in key_columns): row for row in rows}
+        if not pending:
+            return 0, 0, 0
+        columns = list(dict.fromkeys(column for row in pending.values() for column in row))
+        existing = {
+            tuple(row[column] for column in key_columns): row
+            for row in self.select_all(table, ", ".join(dict.fromkeys(["id"] + columns)), **filters)
+        }
+
+        now = datetime.now(UTC).isoformat()
+        updates, inserts, unchanged = [], [], 0
+        for key, row in pending.items():
+            stored = existing.get(key)
+            if stored is None:
+                if insert_missing:
+                    inserts.append({**row, "updated_at": now})
+            elif all(values_equal(value, stored.get(column)) for column, value in row.items()):
+                unchanged += 1
+            else:
+                updates.append({"id": stored["id"], **row, "updated_at": now})
+
+        # Los lotes son independientes entre sí: se envían en paralelo
+        with ParallelWriter() as writer:
+            for start in range(0, len(updates), batch_size):
+                writer.submit(f"{table} upsert {start}", db_execute, table, "upsert",
+                              get_supabase().table(table).upsert(updates[start:start + batch_size], on_conflict="id"))
+            for start in range(0, len(inserts), batch_size):
+                writer.submit(f"{table} insert {start}", db_execute, table, "insert",
+                              get_supabase().table(table).insert(inserts[start:start + batch_size]))
+        return len(inserts), len(updates), unchanged
+
+    def insert_rows(self, table, rows):
+        """Insertar un lote sin leer lo existente ni pedir las filas de vuelta"""
+        db_execute(table, "insert", get_supabase().table(table).insert(rows, returning="minimal"), rows=len(rows))
+
+    def delete_rows(self, table, **filters):
+        query = get_supabase().table(table).delete(returning="minimal")
+        for column, value in filters.items():
+            query = query.eq(column, value)
+        db_execute(table, "delete", query)
+
+class PostgresBackend:
+    """Conexión directa a Postgres para cargas grandes.
+
+    Cada escritura copia las filas con COPY a una tabla temporal y las fusiona con
+    dos sentencias en bloque dentro de una transacción: un UPDATE de las filas cuya
+    clave existe y cuyo contenido cambia, y un INSERT de las que no existen. Las
+    claves se comparan con IS NOT DISTINCT FROM porque ``race_id`` es nulo en las
+    filas de temporada. psycopg solo se importa si se elige este backend.
+    """
+
+    name = "postgres"
+
+    def __init__(self, dsn):
+        try:
+            import psycopg
+            from psycopg import sql
+            from psycopg.rows import dict_row
+        except ImportError as e:
+            raise RuntimeError("El backend postgres necesita psycopg: pip install 'psycopg[binary]'") from e
+        self._psycopg = psycopg
+        self._sql = sql
+        self._dict_row = dict_row
+        self.dsn = dsn
+        # Una conexión por hilo: el backfill escribe varias temporadas a la vez
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or conn.closed:
+            conn = self._psycopg.connect(self.dsn, autocommit=True, row_factory=self._dict_row,
+                                         connect_timeout=max(1, int(DB_REQUEST_TIMEOUT)),
+                                         options=f"-c statement_timeout={int(DB_REQUEST_TIMEOUT * 1000)}")
+            self._local.conn = conn
+        return conn
+
+    def _where(self, alias, filters):
+        sql = self._sql
+        return [sql.SQL("{}.{} = {}").format(sql.Identifier(alias), sql.Identifier(column), sql.Literal(value))
+                for column, value in filters.items()]
+
+    def select_all(self, table, columns, **filters):
+        """Leer todas las filas de una tabla en una sola consulta"""
+        sql = self._sql
+        if columns.strip() == "*":
+            selected = sql.SQL("*")
+        else:
+            selected = sql.SQL(", ").join(sql.Identifier(column.strip()) for column in columns.split(","))
+        query = sql.SQL("SELECT {} FROM {} AS t").format(selected, sql.Identifier(table))
+        conditions = self._where("t", filters)
+        if conditions:
+            query += sql.SQL(" WHERE ") + sql.SQL(" AND ").join(conditions)
+        start = time.perf_counter()
+        rows = []
+        try:
+            rows = self._connection().execute(query).fetchall()
+            # Mismo formato que la API REST: fechas como texto ISO
+            return [{column: value.isoformat() if isinstance(value, datetime) else value
+                     for column, value in row.items()} for row in rows]
+        finally:
+            metrics.record_db(table, "select", time.perf_counter() - start, rows=len(rows))
+
+    def upsert_rows(self, table, rows, key_columns, batch_size=UPSERT_BATCH_SIZE, insert_missing=True, **filters):
+        """Fusionar las filas con COPY y sentencias en bloque; devuelve (insertadas, actualizadas, sin cambios)"""
+        sql = self._sql
+        pending = {tuple(row[column] for column in key_columns): row for row in rows}
+        if not pending:
+            return 0, 0, 0
+        columns = list(dict.fromkeys(column for row in pending.values() for column in row))
+        value_columns = [column for column in columns if column not in key_columns]
+        target, staging = sql.Identifier(table), sql.Identifier(f"staging_{table}")
+
+        def column_list(alias, names):
+            return sql.SQL(", ").join(sql.SQL("{}.{}").format(sql.Identifier(alias), sql.Identifier(name))
+                                      for name in names)
+
+        same_key = sql.SQL(" AND ").join(
+            sql.SQL("t.{0} IS NOT DISTINCT FROM s.{0}").format(sql.Identifier(column)) for column in key_columns)
+        conditions = [same_key] + self._where("t", filters)
+        if value_columns:
+            conditions.append(sql.SQL("({}) IS DISTINCT FROM ({})").format(
+                column_list("t", value_columns), column_list("s", value_columns)))
+        update = sql.SQL("UPDATE {} AS t SET {}, updated_at = now() FROM {} AS s WHERE {}").format(
+            target,
+            sql.SQL(", ").join(sql.SQL("{0} = s.{0}").format(sql.Identifier(column)) for column in columns),
+            staging,
+            sql.SQL(" AND ").join(conditions))
+        insert = sql.SQL(
+            "INSERT INTO {} ({}, updated_at) SELECT {}, now() FROM {} AS s "
+            "WHERE NOT EXISTS (SELECT 1 FROM {} AS t WHERE {}) ON CONFLICT DO NOTHING").format(
+            target, sql.SQL(", ").join(map(sql.Identifier, columns)), column_list("s", columns),
+            staging, target, same_key)
+
+        conn = self._connection()
+        with conn.transaction():
+            conn.execute(sql.SQL("CREATE TEMP TABLE {} ON COMMIT DROP AS SELECT {} FROM {} WITH NO DATA").format(
+                staging, sql.SQL(", ").join(map(sql.Identifier, columns)), target))
+            start = time.perf_counter()
+            with conn.cursor().copy(sql.SQL("COPY {} ({}) FROM STDIN").format(
+                    staging, sql.SQL(", ").join(map(sql.Identifier, columns)))) as copy_stream:
+                for row in pending.values():
+                    copy_stream.write_row([row.get(column) for column in columns])
+            metrics.record_db(table, "copy", time.perf_counter() - start, rows=len(pending))
+
+            start = time.perf_counter()
+            updated = conn.execute(update).rowcount
+            inserted = conn.execute(insert).rowcount if insert_missing else 0
+            metrics.record_db(table, "merge", time.perf_counter() - start, rows=inserted + updated)
+        return inserted, updated, len(pending) - inserted - updated
+
+    def insert_rows(self, table, rows):
+        """Copiar un lote directamente a la tabla con COPY"""
+        sql = self._sql
+        columns = list(dict.fromkeys(column for row in rows for column in row))
+        start = time.perf_counter()
+        with self._connection().cursor().copy(sql.SQL("COPY {} ({}) FROM STDIN").format(
+                sql.Identifier(table), sql.SQL(", ").join(map(sql.Identifier, columns)))) as copy_stream:
+            for row in rows:
+                copy_stream.write_row([row.get(column) for column in columns])
+        metrics.record_db(table, "copy", time.perf_counter() - start, rows=len(rows))
+
+    def delete_rows(self, table, **filters):
+        sql = self._sql
+        query = sql.SQL("DELETE FROM {} AS t WHERE {}").format(
+            sql.Identifier(table), sql.SQL(" AND ").join(self._where("t", filters)))
+        start = time.perf_counter()
+        rowcount = self._connection().execute(query).rowcount
+        metrics.record_db(table, "delete", time.perf_counter() - start, rows=rowcount)
+
+def create_storage_backend(name=None):
+    """Crear el backend de almacenamiento indicado.
+
+    Por defecto se usa F1_STORAGE_BACKEND: "rest" (API de Supabase) o "postgres"
+    (conexión directa con DATABASE_URL).
+    """
+    name = name or os.getenv("F1_STORAGE_BACKEND", "rest")
+    if name == "rest":
+        return RestBackend()
+    if name == "postgres":
+        database_url = os.getenv("DATABASE_URL")
+        if not database_url:
+            raise RuntimeError("El backend postgres necesita la variable DATABASE_URL")
+        return PostgresBackend(database_url)
+    raise ValueError(f"Backend de almacenamiento desconocido: {name}")
+
+# Backend en uso, creado en el primer acceso a la base de datos (ver get_storage)
+storage = None
+storage_lock = threading.Lock()
+
+def get_storage():
+    """Backend de almacenamiento de la ejecución, creado la primera vez que se necesita"""
+    global storage
+    if storage is None:
+        with storage_lock:
+            if storage is None:
+                load_dotenv()
+                storage = create_storage_backend()
+    return storage
+
+@timed
+def fetch_races(season=DEFAULT_SEASON):
+    """Obtener el calendario de carreras de una temporada, incluyendo datos de sprint"""
+    try:
+        response = api_get(f"{season_url(season)}/races.json")
         response.raise_for_status()
-        data = response.json()["MRData"]["RaceTable"]["Races"]
+        data = decode_json(response)["MRData"]["RaceTable"]["Races"]
     except requests.RequestException as e:
         print(f"Error al obtener carreras: {e}")
         return []
-    
-    races = []
-    for race in data:
-        race_date = datetime.strptime(race["date"], "%Y-%m-%d")
-        fp1_date = race.get("FirstPractice", {}).get("date")
-        fp1_time = race.get("FirstPractice", {}).get("time", "00:00:00Z")
-        fp1 = f"{fp1_date}T{fp1_time}" if fp1_date else None
-        
-        fp2_date = race.get("SecondPractice", {}).get("date")
-        fp2_time = race.get("SecondPractice", {}).get("time", "00:00:00Z")
-        fp2 = f"{fp2_date}T{fp2_time}" if fp2_date else None
-        
-        fp3_date = race.get("ThirdPractice", {}).get("date")
-        fp3_time = race.get("ThirdPractice", {}).get("time", "00:00:00Z")
-        fp3 = f"{fp3_date}T{fp3_time}" if fp3_date else None
-        
-        qual_date = race.get("Qualifying", {}).get("date")
-        qual_time = race.get("Qualifying", {}).get("time", "00:00:00Z")
-        qual = f"{qual_date}T{qual_time}" if qual_date else None
-        
-        sprint_qual_date = race.get("SprintQualifying", {}).get("date")
-        sprint_qual_time = race.get("SprintQualifying", {}).get("time", "00:00:00Z")
-        sprint_qual = f"{sprint_qual_date}T{sprint_qual_time}" if sprint_qual_date else None
-        
-        sprint_race_date = race.get("Sprint", {}).get("date")
-        sprint_race_time = race.get("Sprint", {}).get("time", "00:00:00Z")
-        sprint_race = f"{sprint_race_date}T{sprint_race_time}" if sprint_race_date else None
-        
-        race_name = race.get("raceName") or "Unknown Race"
-        season_year = 2025
+    races = [Race.from_api(race).to_row() for race in data]
+    mirror.store_calendar(season, races)
+    return races
 
-        if not race_name:
-            print(f"Advertencia: raceName no encontrado para una carrera: {race}")
-            continue
+def require_calendar(season, races):
+    """Abortar si el calendario de una temporada falló o llegó vacío.
 
-        races.append({
-            "race_name": race_name,
-            "circuit_name": race["Circuit"]["circuitName"],
-            "circuit_location": race["Circuit"]["Location"]["locality"],
-            "circuit_country": race["Circuit"]["Location"]["country"],
-            "race_date": race_date.isoformat(),
-            "fp1_time": fp1,
-            "fp2_time": fp2,
-            "fp3_time": fp3,
-            "qualifying_time": qual,
-            "race_time": f"{race['date']}T{race['time']}",
-            "sprint_qualifying_time": sprint_qual,
-            "sprint_race_time": sprint_race,
-            "season_year": season_year,
-            "updated_at": datetime.now(UTC).isoformat()
-        })
+    Un calendario vacío no es un calendario más corto: tratarlo así llevaría la
+    marca de sincronización a la ronda 0 y se guardaría en el estado.
+    """
+    if not races:
+        raise RuntimeError(f"No se pudo cargar el calendario de {season}; se aborta sin tocar el estado.")
     return races
 
-def fetch_sprint_results(round_number):
-    """Obtener resultados de la carrera sprint para una ronda específica"""
-    try:
-        response = requests.get(f"{API_BASE_URL}/{round_number}/sprint.json")
-        if response.status_code == 429:
-            print("Error 429: Too Many Requests al obtener resultados de sprint.")
-            sys.exit(429)
-        if response.status_code != 200 or not response.json()["MRData"]["RaceTable"]["Races"]:
-            print(f"No hay datos de sprint para la ronda {round_number}.")
-            return []
-        race_data = response.json()["MRData"]["RaceTable"]["Races"][0]
-        race_name = race_data["raceName"]
-        sprint_results_data = race_data.get("SprintResults", [])
-    except requests.RequestException as e:
-        print(f"Error al obtener resultados de sprint para ronda {round_number}: {e}")
-        return []
-    
+def parse_sprint_results(race_data):
+    """Convertir los resultados de sprint de una carrera de la API en filas con IDs resueltos"""
+    race = Race.from_api(race_data)
+
     sprint_results = []
-    for result in sprint_results_data:
-        driver_code = result["Driver"]["code"]
-        driver_id_response = supabase.table("drivers").select("id").eq("driver_code", driver_code).execute()
-        if not driver_id_response.data:
+    for result in map(Result.from_api, race_data.get("SprintResults", [])):
+        driver_code = result.driver.code
+        driver_id = id_resolver.driver_id(result.driver.driver_id)
+        if driver_id is None:
             print(f"Piloto con código {driver_code} no encontrado en la tabla drivers.")
             continue
-        driver_id = driver_id_response.data[0]["id"]
-        
-        race_id_response = supabase.table("calendar").select("id").eq("race_name", race_name).eq("season_year", 2025).execute()
-        if not race_id_response.data:
-            print(f"Carrera {race_name} no encontrada en la tabla calendar.")
+
+        race_id = id_resolver.race_id(race.name, race.season)
+        if race_id is None:
+            print(f"Carrera {race.name} no encontrada en la tabla calendar.")
             continue
-        race_id = race_id_response.data[0]["id"]
 
-        position = int(result.get("position", 0))
-        if position <= 0:
-            print(f"Posición inválida ({position}) para el piloto {driver_code} en la carrera sprint {race_name}. Saltando.")
+        team_name = result.constructor.name
+        team_id = id_resolver.team_id(team_name)
+        if team_id is None:
+            print(f"Equipo {team_name} no encontrado en la tabla teams.")
+            continue
+
+        if result.position <= 0:
+            print(f"Posición inválida ({result.position}) para el piloto {driver_code} en la carrera sprint {race.name}. Saltando.")
             continue
 
         sprint_results.append({
             "driver_id": driver_id,
             "race_id": race_id,
-            "position": position,
-            "points": int(float(result.get("points", 0))),
-            "team_id": supabase.table("teams").select("id").eq("team_name", result["Constructor"]["name"]).execute().data[0]["id"]
+            "position": result.position,
+            "points": int(result.points),
+            "team_id": team_id
         })
     return sprint_results
 
-def fetch_qualifying_results(round_number):
-    """Obtener resultados de clasificación para una ronda específica"""
-    try:
-        response = requests.get(f"{API_BASE_URL}/{round_number}/qualifying.json")
-        if response.status_code == 429:
-            print("Error 429: Too Many Requests al obtener resultados de clasificación.")
-            sys.exit(429)
-        if response.status_code != 200 or not response.json()["MRData"]["RaceTable"]["Races"]:
-            print(f"No hay datos de clasificación para la ronda {round_number}.")
-            return []
-        race_data = response.json()["MRData"]["RaceTable"]["Races"][0]
-        race_name = race_data["raceName"]
-        qualifying_results_data = race_data.get("QualifyingResults", [])
-    except requests.RequestException as e:
-        print(f"Error al obtener resultados de clasificación para ronda {round_number}: {e}")
-        return []
-    
+def parse_qualifying_results(race_data):
+    """Convertir la clasificación de una carrera de la API en filas con IDs resueltos"""
+    race = Race.from_api(race_data)
+
     qualifying_results = []
-    for result in qualifying_results_data:
-        driver_code = result["Driver"]["code"]
-        driver_id_response = supabase.table("drivers").select("id").eq("driver_code", driver_code).execute()
-        if not driver_id_response.data:
+    for result in map(Result.from_api, race_data.get("QualifyingResults", [])):
+        driver_code = result.driver.code
+        driver_id = id_resolver.driver_id(result.driver.driver_id)
+        if driver_id is None:
             print(f"Piloto con código {driver_code} no encontrado en la tabla drivers.")
             continue
-        driver_id = driver_id_response.data[0]["id"]
-        
-        race_id_response = supabase.table("calendar").select("id").eq("race_name", race_name).eq("season_year", 2025).execute()
-        if not race_id_response.data:
-            print(f"Carrera {race_name} no encontrada en la tabla calendar.")
+
+        race_id = id_resolver.race_id(race.name, race.season)
+        if race_id is None:
+            print(f"Carrera {race.name} no encontrada en la tabla calendar.")
             continue
-        race_id = race_id_response.data[0]["id"]
 
-        position = int(result.get("position", 0))
-        if position <= 0:
+        if result.position <= 0:
             continue
 
         qualifying_results.append({
             "driver_id": driver_id,
             "race_id": race_id,
-            "position": position
+            "position": result.position
         })
     return qualifying_results
 
-def fetch_drivers():
-    """Obtener lista de pilotos"""
+@timed
+def fetch_drivers(season=DEFAULT_SEASON):
+    """Obtener lista de pilotos de una temporada"""
     try:
-        response = requests.get(f"{API_BASE_URL}/drivers.json")
-        if response.status_code == 429:
-            print("Error 429: Too Many Requests al obtener pilotos.")
-            sys.exit(429)
-        response.raise_for_status()
-        data = response.json()["MRData"]["DriverTable"]["Drivers"]
+        data = [driver for page in iter_pages(f"{season_url(season)}/drivers.json")
+                for driver in page["DriverTable"]["Drivers"]]
     except requests.RequestException as e:
         print(f"Error al obtener pilotos: {e}")
         return []
-    return [{
-        "driver_code": driver["code"],
-        "first_name": driver["givenName"],
-        "last_name": driver["familyName"],
-        "nationality": driver["nationality"],
-        "updated_at": datetime.now(UTC).isoformat()
-    } for driver in data]
-
-def fetch_teams():
-    """Obtener lista de equipos"""
+    return [Driver.from_api(driver).to_row() for driver in data]
+
+@timed
+def fetch_teams(season=DEFAULT_SEASON):
+    """Obtener lista de equipos de una temporada"""
     try:
-        response = requests.get(f"{API_BASE_URL}/constructors.json")
-        if response.status_code == 429:
-            print("Error 429: Too Many Requests al obtener equipos.")
-            sys.exit(429)
-        response.raise_for_status()
-        data = response.json()["MRData"]["ConstructorTable"]["Constructors"]
+        data = [constructor for page in iter_pages(f"{season_url(season)}/constructors.json")
+                for constructor in page["ConstructorTable"]["Constructors"]]
     except requests.RequestException as e:
         print(f"Error al obtener equipos: {e}")
         return []
-    return [{
-        "team_name": constructor["name"],
-        "nationality": constructor["nationality"],
-        "updated_at": datetime.now(UTC).isoformat()
-    } for constructor in data]
-
-def fetch_standings():
-    """Obtener clasificaciones de pilotos y equipos"""
+    return [Constructor.from_api(constructor).to_row() for constructor in data]
+
+@timed
+def fetch_standings(season=DEFAULT_SEASON):
+    """Obtener clasificaciones de pilotos y equipos de una temporada, pidiendo las dos a la vez"""
     try:
-        driver_response = requests.get(f"{API_BASE_URL}/driverStandings.json")
-        if driver_response.status_code == 429:
-            print("Error 429: Too Many Requests al obtener clasificaciones de pilotos.")
-            sys.exit(429)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            driver_response, team_response = executor.map(api_get, [
+                f"{season_url(season)}/driverStandings.json",
+                f"{season_url(season)}/constructorStandings.json",
+            ])
         driver_response.raise_for_status()
-        team_response = requests.get(f"{API_BASE_URL}/constructorStandings.json")
-        if team_response.status_code == 429:
-            print("Error 429: Too Many Requests al obtener clasificaciones de equipos.")
-            sys.exit(429)
         team_response.raise_for_status()
-        
-        driver_data = driver_response.json()["MRData"]["StandingsTable"]["StandingsLists"]
-        team_data = team_response.json()["MRData"]["StandingsTable"]["StandingsLists"]
-        print(f"Datos de driverStandings: {driver_data}")
-        print(f"Datos de constructorStandings: {team_data}")
 
-        driver_standings_list = driver_data[0]["DriverStandings"] if driver_data else []
-        team_standings_list = team_data[0]["ConstructorStandings"] if team_data else []
+        driver_data = decode_json(driver_response)["MRData"]["StandingsTable"]["StandingsLists"]
+        team_data = decode_json(team_response)["MRData"]["StandingsTable"]["StandingsLists"]
+
+        driver_standings_list = [Standing.from_api(s) for s in driver_data[0]["DriverStandings"]] if driver_data else []
+        team_standings_list = [Standing.from_api(s) for s in team_data[0]["ConstructorStandings"]] if team_data else []
     except requests.RequestException as e:
         print(f"Error al obtener clasificaciones: {e}")
         return [], []
-    
+
     driver_standings = []
     for standing in driver_standings_list:
-        if standing.get("positionText") == "-":
-            print(f"Piloto {standing['Driver']['code']} no tiene posición definida. Saltando.")
+        driver_code = standing.driver.code
+        if standing.position is None:
+            print(f"Piloto {driver_code} no tiene posición definida. Saltando.")
             continue
 
-        driver_code = standing["Driver"]["code"]
-        driver_id_response = supabase.table("drivers").select("id").eq("driver_code", driver_code).execute()
-        if not driver_id_response.data:
+        driver_id = id_resolver.driver_id(standing.driver.driver_id)
+        if driver_id is None:
             print(f"Piloto con código {driver_code} no encontrado en la tabla drivers.")
             continue
-        driver_id = driver_id_response.data[0]["id"]
 
-        position = int(standing.get("position", 0))
-        if position <= 0:
-            print(f"Posición inválida ({position}) para el piloto {driver_code}. Saltando.")
+        if standing.position <= 0:
+            print(f"Posición inválida ({standing.position}) para el piloto {driver_code}. Saltando.")
             continue
 
         driver_standings.append({
             "driver_id": driver_id,
             "race_id": None,
-            "position": position,
-            "total_points": int(float(standing.get("points", 0))),
-            "season_year": 2025,
-            "updated_at": datetime.now(UTC).isoformat()
+            "position": standing.position,
+            "total_points": int(standing.points),
+            "season_year": season
         })
-    
+
     team_standings = []
     for standing in team_standings_list:
-        if standing.get("positionText") == "-":
-            print(f"Equipo {standing['Constructor']['name']} no tiene posición definida. Saltando.")
+        team_name = standing.constructor.name
+        if standing.position is None:
+            print(f"Equipo {team_name} no tiene posición definida. Saltando.")
             continue
 
-        team_name = standing["Constructor"]["name"]
-        team_id_response = supabase.table("teams").select("id").eq("team_name", team_name).execute()
-        if not team_id_response.data:
+        team_id = id_resolver.team_id(team_name)
+        if team_id is None:
             print(f"Equipo {team_name} no encontrado en la tabla teams.")
             continue
-        team_id = team_id_response.data[0]["id"]
 
-        position = int(standing.get("position", 0))
-        if position <= 0:
-            print(f"Posición inválida ({position}) para el equipo {team_name}. Saltando.")
+        if standing.position <= 0:
+            print(f"Posición inválida ({standing.position}) para el equipo {team_name}. Saltando.")
             continue
 
         team_standings.append({
             "team_id": team_id,
             "race_id": None,
-            "position": position,
-            "total_points": int(float(standing.get("points", 0))),
-            "season_year": 2025,
-            "updated_at": datetime.now(UTC).isoformat()
+            "position": standing.position,
+            "total_points": int(standing.points),
+            "season_year": season
         })
-    
+
+    mirror.store_standings(season, driver_standings, team_standings)
     return driver_standings, team_standings
 
-def fetch_race_results(round_number):
-    """Obtener resultados de la carrera principal para una ronda específica"""
-    try:
-        response = requests.get(f"{API_BASE_URL}/{round_number}/results.json")
-        if response.status_code == 429:
-            print("Error 429: Too Many Requests al obtener resultados de carrera.")
-            sys.exit(429)
-        if response.status_code != 200 or not response.json()["MRData"]["RaceTable"]["Races"]:
-            print(f"No hay datos de resultados para la ronda {round_number}.")
-            return []
-        race_data = response.json()["MRData"]["RaceTable"]["Races"][0]
-        race_name = race_data["raceName"]
-        results_data = race_data.get("Results", [])
-    except requests.RequestException as e:
-        print(f"Error al obtener resultados para ronda {round_number}: {e}")
-        return []
-    
+class StandingsSnapshot:
+    """Clasificaciones de una temporada con las posiciones indexadas por ID"""
+
+    def __init__(self, season, driver_standings, team_standings):
+        self.season = season
+        self.driver_standings = driver_standings
+        self.team_standings = team_standings
+        self._driver_positions = {standing["driver_id"]: standing["position"] for standing in driver_standings}
+        self._team_positions = {standing["team_id"]: standing["position"] for standing in team_standings}
+
+    def driver_position(self, driver_id):
+        """Posición del piloto en el campeonato; 0 si no aparece en la clasificación"""
+        return self._driver_positions.get(driver_id, 0)
+
+    def team_position(self, team_id):
+        """Posición del equipo en el campeonato; 0 si no aparece en la clasificación"""
+        return self._team_positions.get(team_id, 0)
+
+class StandingsService:
+    """Una instantánea de las clasificaciones por temporada y ejecución, compartida por todas las etapas.
+
+    La primera etapa que la pide la descarga con fetch_standings y las demás, aunque
+    la pidan a la vez desde otros hilos, esperan y reutilizan el resultado.
+    ``invalidate`` la descarta cuando la clasificación puede haber cambiado, como
+    tras cada sesión en modo live.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._season_locks = {}
+        self._snapshots = {}
+
+    def get(self, season):
+        with self._lock:
+            season_lock = self._season_locks.setdefault(season, threading.Lock())
+        with season_lock:
+            snapshot = self._snapshots.get(season)
+            if snapshot is None:
+                snapshot = StandingsSnapshot(season, *fetch_standings(season))
+                self._snapshots[season] = snapshot
+            return snapshot
+
+    def invalidate(self, season):
+        with self._lock:
+            self._snapshots.pop(season, None)
+
+standings_service = StandingsService()
+
+def parse_race_results(race_data):
+    """Convertir los resultados de carrera de la API en filas con IDs resueltos"""
+    race = Race.from_api(race_data)
+
     results = []
-    for result in results_data:
-        driver_code = result["Driver"]["code"]
-        driver_id_response = supabase.table("drivers").select("id").eq("driver_code", driver_code).execute()
-        if not driver_id_response.data:
+    for result in map(Result.from_api, race_data.get("Results", [])):
+        driver_code = result.driver.code
+        driver_id = id_resolver.driver_id(result.driver.driver_id)
+        if driver_id is None:
             print(f"Piloto con código {driver_code} no encontrado en la tabla drivers.")
             continue
-        driver_id = driver_id_response.data[0]["id"]
-        
-        race_id_response = supabase.table("calendar").select("id").eq("race_name", race_name).eq("season_year", 2025).execute()
-        if not race_id_response.data:
-            print(f"Carrera {race_name} no encontrada en la tabla calendar.")
+
+        race_id = id_resolver.race_id(race.name, race.season)
+        if race_id is None:
+            print(f"Carrera {race.name} no encontrada en la tabla calendar.")
             continue
-        race_id = race_id_response.data[0]["id"]
 
-        team_name = result["Constructor"]["name"]
-        team_id_response = supabase.table("teams").select("id").eq("team_name", team_name).execute()
-        if not team_id_response.data:
+        team_name = result.constructor.name
+        team_id = id_resolver.team_id(team_name)
+        if team_id is None:
             print(f"Equipo {team_name} no encontrado en la tabla teams.")
             continue
-        team_id = team_id_response.data[0]["id"]
 
-        position = int(result.get("position", 0))
-        if position <= 0:
+        if result.position <= 0:
             continue  # Saltar si no hay posición válida (por ejemplo, DNF)
 
         results.append({
             "driver_id": driver_id,
             "race_id": race_id,
             "team_id": team_id,
-            "position": position,
-            "points": int(float(result.get("points", 0))),
-            "fastest_lap": result.get("FastestLap", {}).get("rank") == "1"
+            "position": result.position,
+            "points": int(result.points),
+            "fastest_lap": result.fastest_lap
         })
     return results
 
-def update_statistics(races):
-    """Actualizar estadísticas de pilotos y equipos basadas en resultados de carreras, sprint y clasificación"""
-    driver_stats = {}
-    team_stats = {}
+# Capacidad de la cola entre la descarga de resultados y su transformación (carreras)
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "64"))
+
+# Filas por página en los endpoints paginados (máximo admitido por Jolpica)
+API_PAGE_LIMIT = 100
+
+# Endpoint, clave de resultados, parser y etiqueta de cada conjunto de resultados
+RESULT_DATASETS = (
+    ("results", "Results", parse_race_results, "resultados"),
+    ("sprint", "SprintResults", parse_sprint_results, "sprint"),
+    ("qualifying", "QualifyingResults", parse_qualifying_results, "clasificación"),
+)
+RESULT_PARSERS = {endpoint: parser for endpoint, _, parser, _ in RESULT_DATASETS}
+
+@timed
+def fetch_round_race(season, round_number, endpoint, settled=False):
+    """Descargar la carrera de una ronda con sus resultados, sin resolver IDs (None si no hay datos)"""
+    label = next(label for name, _, _, label in RESULT_DATASETS if name == endpoint)
+    try:
+        response = api_get(f"{season_url(season)}/{round_number}/{endpoint}.json", immutable=settled)
+        races = decode_json(response)["MRData"]["RaceTable"]["Races"] if response.status_code == 200 else []
+        if not races:
+            print(f"No hay datos de {label} para la ronda {round_number}.")
+            return None
+        return races[0]
+    except requests.RequestException as e:
+        print(f"Error al obtener {label} para ronda {round_number}: {e}")
+        return None
+
+def iter_pages(url, immutable=False, cached=True):
+    """Recorrer un endpoint paginado de Jolpica devolviendo el MRData de cada página.
+
+    Con ``cached=False`` las páginas no pasan por la caché en disco, para datos
+    voluminosos que solo se descargan una vez.
+    """
+    offset = 0
+    while True:
+        page_url = f"{url}?limit={API_PAGE_LIMIT}&offset={offset}"
+        response = api_get(page_url, immutable=immutable) if cached else http_get(page_url)
+        response.raise_for_status()
+        data = decode_json(response)["MRData"]
+        yield data
+        offset += int(data["limit"])
+        if offset >= int(data["total"]):
+            return
+
+def iter_season_races(season, endpoint, results_key, immutable=False):
+    """Recorrer las carreras de un endpoint de temporada uniendo rondas partidas entre páginas.
+
+    La paginación de la API es por fila de resultado, así que una misma ronda puede
+    aparecer al final de una página y al principio de la siguiente. Cada carrera se
+    entrega en cuanto empieza la siguiente, sin cargar la temporada entera en memoria.
+    """
+    current = None
+    for page in iter_pages(f"{season_url(season)}/{endpoint}.json", immutable=immutable):
+        for race in page["RaceTable"]["Races"]:
+            if current is not None and current["round"] == race["round"]:
+                current[results_key].extend(race.get(results_key, []))
+                continue
+            if current is not None:
+                yield current
+            current = race
+            current.setdefault(results_key, [])
+    if current is not None:
+        yield current
+
+class StageCancelled(Exception):
+    """El consumidor de una etapa del pipeline dejó de leer"""
+
+class PipelineStage:
+    """Productor en un hilo propio que entrega elementos a través de una cola acotada.
+
+    ``produce`` recibe una función ``put``; cuando la cola está llena ``put`` se
+    bloquea, de modo que el productor nunca adelanta al consumidor en más de
+    ``maxsize`` elementos. Los errores del productor se relanzan al iterar y, si
+    el consumidor abandona, ``put`` lanza StageCancelled para detener la descarga.
+    """
+
+    _DONE = object()
+
+    def __init__(self, produce, maxsize=PIPELINE_QUEUE_SIZE):
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._cancelled = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(produce,), daemon=True)
+        self._thread.start()
+
+    def _put(self, item):
+        while not self._cancelled.is_set():
+            try:
+                self._queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+        raise StageCancelled()
+
+    def _run(self, produce):
+        try:
+            produce(self._put)
+            self._put(self._DONE)
+        except StageCancelled:
+            pass
+        except BaseException as e:
+            try:
+                self._put(e)
+            except StageCancelled:
+                pass
+
+    def __iter__(self):
+        try:
+            while True:
+                item = self._queue.get()
+                if item is self._DONE:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            self.close()
+
+    def close(self):
+        """Detener el productor aunque no se haya consumido todo"""
+        self._cancelled.set()
+
+def session_started(race, endpoint):
+    """Si la sesión de ``endpoint`` de una ronda ya ha empezado según el calendario.
+
+    Los calendarios antiguos no traen la hora de cada sesión: se usa la de la carrera.
+    """
+    column = next(column for column, name, _ in LIVE_SESSIONS if name == endpoint)
+    start = parse_timestamp(race.get(column)) or parse_timestamp(race["race_date"])
+    return start is None or start <= datetime.now(UTC)
+
+def stream_round_races(season, races, first_round=1, workers=FETCH_WORKERS, skip=frozenset()):
+    """Descargar en segundo plano las rondas desde ``first_round``, una petición por endpoint y ronda.
 
+    Entrega tuplas (ronda, endpoint, carrera sin resolver); las rondas ya asentadas
+    se sirven desde la caché en disco sin revalidar. Los pares (ronda, endpoint)
+    de ``skip`` no se piden, ni las sesiones que según el calendario aún no han empezado.
+    """
+    tasks = [(round_number, endpoint, round_is_settled(race))
+             for round_number, race in enumerate(races, first_round) for endpoint, _, _, _ in RESULT_DATASETS
+             if (round_number, endpoint) not in skip and session_started(race, endpoint)]
+
+    def produce(put):
+        def fetch(task):
+            round_number, endpoint, settled = task
+            race_data = fetch_round_race(season, round_number, endpoint, settled=settled)
+            if race_data is not None:
+                put((round_number, endpoint, race_data))
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            list(executor.map(fetch, tasks))
+
+    return PipelineStage(produce)
+
+def stream_season_races(season, races, skip=frozenset()):
+    """Descargar en segundo plano la temporada con los endpoints paginados.
+
+    Entrega las mismas tuplas que stream_round_races con unas pocas páginas por
+    conjunto de datos en lugar de tres peticiones por ronda, y (None, endpoint, None)
+    al terminar cada conjunto. Una temporada terminada se sirve desde la caché; los
+    endpoints de ``skip`` no se piden.
+    """
+    season_settled = bool(races) and round_is_settled(races[-1])
+
+    def produce(put):
+        def fetch(dataset):
+            endpoint, results_key, _, _ = dataset
+            try:
+                for race in iter_season_races(season, endpoint, results_key, immutable=season_settled):
+                    put((int(race["round"]), endpoint, race))
+                put((None, endpoint, None))
+            except requests.RequestException as e:
+                print(f"Error al obtener {endpoint} de la temporada {season}: {e}")
+                raise
+        with ThreadPoolExecutor(max_workers=len(RESULT_DATASETS)) as executor:
+            list(executor.map(fetch, [dataset for dataset in RESULT_DATASETS if dataset[0] not in skip]))
+
+    return PipelineStage(produce)
+
+def collect_round_results(stream, first_round, last_round, checkpoint=None):
+    """Resolver IDs de lo que entrega un stream y agrupar por ronda.
+
+    Devuelve una lista ordenada por ronda con tuplas (carrera, sprint, clasificación),
+    de modo que la agregación posterior es idéntica a la secuencial. Con ``checkpoint``
+    parte de las rondas ya descargadas en un intento anterior y anota las nuevas.
+    """
+    by_round = {}
+    if checkpoint is not None:
+        for round_number, endpoint in checkpoint.fetched_rounds():
+            if first_round <= round_number <= last_round:
+                by_round.setdefault(round_number, {})[endpoint] = checkpoint.round_rows(round_number, endpoint)
+    for round_number, endpoint, race_data in stream:
+        if race_data is None:
+            # Fin de un endpoint de temporada
+            if checkpoint is not None:
+                checkpoint.finish_dataset(endpoint)
+            continue
+        rows = RESULT_PARSERS[endpoint](race_data)
+        by_round.setdefault(round_number, {})[endpoint] = rows
+        if checkpoint is not None:
+            checkpoint.add_rows(round_number, endpoint, rows)
+    return [tuple(by_round.get(round_number, {}).get(endpoint, []) for endpoint, _, _, _ in RESULT_DATASETS)
+            for round_number in range(first_round, last_round + 1)]
+
+def accumulate_round(driver_stats, team_stats, race_results, sprint_results, qualifying_results):
+    """Sumar los resultados de una ronda a los contadores acumulados de pilotos y equipos"""
     # Procesar resultados de carreras principales
-    for i, race in enumerate(races, 1):
-        race_results = fetch_race_results(i)
+    for result in race_results:
+        driver_id = result["driver_id"]
+        team_id = result["team_id"]
+        position = result["position"]
+        
+        # Inicializar estadísticas del piloto si no existen
+        if driver_id not in driver_stats:
+            driver_stats[driver_id] = {
+                "race_wins": 0, "sprint_wins": 0, "podiums": 0, "poles": 0, 
+                "total_points": 0, "fastest_laps": 0
+            }
+        # Actualizar estadísticas del piloto
+        driver_stats[driver_id]["total_points"] += result["points"]
+        if position == 1:
+            driver_stats[driver_id]["race_wins"] += 1
+        if position <= 3:  # Solo carreras normales cuentan como podios
+            driver_stats[driver_id]["podiums"] += 1
+        if result["fastest_lap"]:
+            driver_stats[driver_id]["fastest_laps"] += 1
+
+        # Inicializar estadísticas del equipo si no existen
+        if team_id not in team_stats:
+            team_stats[team_id] = {
+                "race_wins": 0, "sprint_wins": 0, "podiums": 0, 
+                "total_points": 0, "fastest_laps": 0
+            }
+        # Actualizar estadísticas del equipo
+        team_stats[team_id]["total_points"] += result["points"]
+        if position == 1:
+            team_stats[team_id]["race_wins"] += 1
+        if position <= 3:  # Solo carreras normales cuentan como podios
+            team_stats[team_id]["podiums"] += 1
+        if result["fastest_lap"]:
+            team_stats[team_id]["fastest_laps"] += 1
+
+    # Procesar resultados de sprint
+    for result in sprint_results:
+        driver_id = result["driver_id"]
+        team_id = result["team_id"]
+        position = result["position"]
+        
+        if driver_id not in driver_stats:
+            driver_stats[driver_id] = {
+                "race_wins": 0, "sprint_wins": 0, "podiums": 0, "poles": 0, 
+                "total_points": 0, "fastest_laps": 0
+            }
+        driver_stats[driver_id]["total_points"] += result["points"]
+        if position == 1:
+            driver_stats[driver_id]["sprint_wins"] += 1
+        # No se cuentan podios en sprints
+
+        if team_id not in team_stats:
+            team_stats[team_id] = {
+                "race_wins": 0, "sprint_wins": 0, "podiums": 0, 
+                "total_points": 0, "fastest_laps": 0
+            }
+        team_stats[team_id]["total_points"] += result["points"]
+        if position == 1:
+            team_stats[team_id]["sprint_wins"] += 1
+        # No se cuentan podios en sprints
+
+    # Procesar resultados de clasificación
+    for result in qualifying_results:
+        driver_id = result["driver_id"]
+        position = result["position"]
+        
+        if driver_id not in driver_stats:
+            driver_stats[driver_id] = {
+                "race_wins": 0, "sprint_wins": 0, "podiums": 0, "poles": 0, 
+                "total_points": 0, "fastest_laps": 0
+            }
+        if position == 1:
+            driver_stats[driver_id]["poles"] += 1
+
+# Contadores de cada piloto y equipo, en el orden en que los inicializa accumulate_round
+DRIVER_COUNTERS = ("race_wins", "sprint_wins", "podiums", "poles", "total_points", "fastest_laps")
+TEAM_COUNTERS = ("race_wins", "sprint_wins", "podiums", "total_points", "fastest_laps")
+
+# "loop" (accumulate_round ronda a ronda) o "numpy" (reducciones agrupadas sobre columnas).
+# Con el tamaño de una temporada el bucle es más rápido: ver benchmarks/bench_aggregation.py
+AGGREGATION_ENGINE = os.getenv("F1_AGGREGATION_ENGINE", "loop")
+
+def import_numpy():
+    """Importar NumPy la primera vez que se necesita; None si no está instalado"""
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:  # Opcional: sin numpy la agregación usa el bucle en Python
+            return None
+        np = numpy
+    return np
+
+def aggregate_rounds_loop(driver_stats, team_stats, round_results):
+    """Acumular las rondas con accumulate_round.
+
+    Devuelve, por ronda, una tupla (contadores de pilotos, de equipos) acumulados
+    hasta ella, sin modificar los contadores de partida.
+    """
+    driver_stats = {driver_id: dict(stats) for driver_id, stats in driver_stats.items()}
+    team_stats = {team_id: dict(stats) for team_id, stats in team_stats.items()}
+    cumulative = []
+    for results in round_results:
+        accumulate_round(driver_stats, team_stats, *results)
+        cumulative.append(({driver_id: dict(stats) for driver_id, stats in driver_stats.items()},
+                           {team_id: dict(stats) for team_id, stats in team_stats.items()}))
+    return cumulative
+
+def _grouped_totals(base, counters, n_rounds, events):
+    """Contadores acumulados por ronda de un conjunto de entidades.
+
+    ``events`` son tuplas (rondas, entidades, {contador: incrementos}) de arrays
+    alineados, en el orden en que el bucle los recorre. Devuelve los IDs en orden
+    de aparición, la primera ronda de cada uno (-1 si venían en ``base``) y un
+    array (rondas, entidades, contadores) ya acumulado a lo largo de las rondas.
+    """
+    rounds = np.concatenate([event[0] for event in events])
+    entities = np.concatenate([event[1] for event in events])
+    # Orden del bucle: por ronda y, dentro de ella, por conjunto de datos y fila
+    dataset = np.concatenate([np.full(len(event[0]), i) for i, event in enumerate(events)])
+    sequence = np.lexsort((np.arange(len(rounds)), dataset, rounds))
+    base_ids = np.fromiter(base, dtype=np.int64, count=len(base))
+    ids, first_seen, inverse = np.unique(np.concatenate([base_ids, entities[sequence]]),
+                                         return_index=True, return_inverse=True)
+    order = np.argsort(first_seen, kind="stable")
+    position_of = np.empty(len(ids), dtype=np.int64)
+    position_of[order] = np.arange(len(ids))
+    entity_index = np.empty(len(entities), dtype=np.int64)
+    entity_index[sequence] = position_of[inverse[len(base_ids):]]
+
+    first_round = np.full(len(ids), n_rounds, dtype=np.int64)
+    first_round[:len(base_ids)] = -1
+    np.minimum.at(first_round, entity_index, rounds)
+
+    # Suma agrupada por (ronda, entidad) de cada contador con bincount sobre un índice plano
+    size = n_rounds * len(ids)
+    totals = np.zeros((len(counters), size), dtype=np.int64)
+    offset = 0
+    for event_rounds, _, increments in events:
+        flat = event_rounds * len(ids) + entity_index[offset:offset + len(event_rounds)]
+        for column, values in increments.items():
+            totals[counters.index(column)] += np.bincount(flat, weights=values, minlength=size).astype(np.int64)
+        offset += len(event_rounds)
+    totals = totals.reshape(len(counters), n_rounds, len(ids)).transpose(1, 2, 0)
+    totals = np.cumsum(totals, axis=0)
+    if len(base_ids):
+        totals[:, :len(base_ids)] += np.array([[stats[c] for c in counters] for stats in base.values()], dtype=np.int64)
+    return ids[order].tolist(), first_round.tolist(), totals
+
+def aggregate_rounds_numpy(driver_stats, team_stats, round_results):
+    """Misma salida que aggregate_rounds_loop con reducciones agrupadas de NumPy.
+
+    Los resultados se cargan en columnas una vez y cada contador se suma con
+    np.bincount sobre un índice plano (ronda, entidad), seguido de una suma
+    acumulada sobre las rondas; la primera ronda de cada entidad sale de
+    np.minimum.at. Los diccionarios conservan el orden de aparición del bucle.
+    """
+    if import_numpy() is None:
+        raise RuntimeError("El motor de agregación numpy necesita NumPy: pip install numpy")
+    n_rounds = len(round_results)
+    if not n_rounds:
+        return []
+
+    def columns(index, fields):
+        rows = [row for results in round_results for row in results[index]]
+        rounds = np.repeat(np.arange(n_rounds), [len(results[index]) for results in round_results])
+        return [rounds] + [np.array(list(map(itemgetter(field), rows)), dtype=np.int64) for field in fields]
+
+    r_round, r_driver, r_team, r_position, r_points, r_fastest = columns(
+        0, ("driver_id", "team_id", "position", "points", "fastest_lap"))
+    s_round, s_driver, s_team, s_position, s_points = columns(1, ("driver_id", "team_id", "position", "points"))
+    q_round, q_driver, q_position = columns(2, ("driver_id", "position"))
+
+    race_increments = {"total_points": r_points, "race_wins": r_position == 1,
+                       "podiums": r_position <= 3, "fastest_laps": r_fastest}
+    sprint_increments = {"total_points": s_points, "sprint_wins": s_position == 1}
+    driver_ids, driver_first, driver_totals = _grouped_totals(driver_stats, DRIVER_COUNTERS, n_rounds, [
+        (r_round, r_driver, race_increments),
+        (s_round, s_driver, sprint_increments),
+        (q_round, q_driver, {"poles": q_position == 1}),
+    ])
+    team_ids, team_first, team_totals = _grouped_totals(team_stats, TEAM_COUNTERS, n_rounds, [
+        (r_round, r_team, race_increments),
+        (s_round, s_team, sprint_increments),
+    ])
+
+    # Las entidades están en orden de aparición, así que las presentes en cada ronda son un prefijo
+    driver_present = np.searchsorted(driver_first, np.arange(n_rounds), side="right").tolist()
+    team_present = np.searchsorted(team_first, np.arange(n_rounds), side="right").tolist()
+    cumulative = []
+    for drivers, teams, n_drivers, n_teams in zip(driver_totals.tolist(), team_totals.tolist(),
+                                                  driver_present, team_present):
+        cumulative.append((
+            {driver_id: dict(zip(DRIVER_COUNTERS, values)) for driver_id, values in zip(driver_ids[:n_drivers], drivers)},
+            {team_id: dict(zip(TEAM_COUNTERS, values)) for team_id, values in zip(team_ids[:n_teams], teams)},
+        ))
+    return cumulative
+
+def aggregate_rounds(driver_stats, team_stats, round_results):
+    """Contadores acumulados tras cada ronda con el motor configurado (NumPy solo si está instalado)"""
+    if AGGREGATION_ENGINE == "numpy" and import_numpy() is not None:
+        return aggregate_rounds_numpy(driver_stats, team_stats, round_results)
+    return aggregate_rounds_loop(driver_stats, team_stats, round_results)
+
+def finishing_counts(counts, round_results, entity):
+    """Veces que cada piloto o equipo ha terminado en cada puesto de carrera, acumuladas tras cada ronda.
+
+    ``counts`` son los conteos de partida ({id: {puesto: veces}}) y ``entity`` la
+    columna del id (driver_id o team_id). Es lo que usa rank_positions para desempatar.
+    """
+    counts = {key: dict(positions) for key, positions in counts.items()}
+    cumulative = []
+    for race_results, _, _ in round_results:
         for result in race_results:
-            driver_id = result["driver_id"]
-            team_id = result["team_id"]
-            position = result["position"]
-            
-            # Inicializar estadísticas del piloto si no existen
-            if driver_id not in driver_stats:
-                driver_stats[driver_id] = {
-                    "race_wins": 0, "sprint_wins": 0, "podiums": 0, "poles": 0, 
-                    "total_points": 0, "fastest_laps": 0
-                }
-            # Actualizar estadísticas del piloto
-            driver_stats[driver_id]["total_points"] += result["points"]
-            if position == 1:
-                driver_stats[driver_id]["race_wins"] += 1
-            if position <= 3:  # Solo carreras normales cuentan como podios
-                driver_stats[driver_id]["podiums"] += 1
-            if result["fastest_lap"]:
-                driver_stats[driver_id]["fastest_laps"] += 1
-
-            # Inicializar estadísticas del equipo si no existen
-            if team_id not in team_stats:
-                team_stats[team_id] = {
-                    "race_wins": 0, "sprint_wins": 0, "podiums": 0, 
-                    "total_points": 0, "fastest_laps": 0
-                }
-            # Actualizar estadísticas del equipo
-            team_stats[team_id]["total_points"] += result["points"]
-            if position == 1:
-                team_stats[team_id]["race_wins"] += 1
-            if position <= 3:  # Solo carreras normales cuentan como podios
-                team_stats[team_id]["podiums"] += 1
-            if result["fastest_lap"]:
-                team_stats[team_id]["fastest_laps"] += 1
-
-        # Procesar resultados de sprint
-        sprint_results = fetch_sprint_results(i)
-        for result in sprint_results:
-            driver_id = result["driver_id"]
-            team_id = result["team_id"]
-            position = result["position"]
-            
-            if driver_id not in driver_stats:
-                driver_stats[driver_id] = {
-                    "race_wins": 0, "sprint_wins": 0, "podiums": 0, "poles": 0, 
-                    "total_points": 0, "fastest_laps": 0
-                }
-            driver_stats[driver_id]["total_points"] += result["points"]
-            if position == 1:
-                driver_stats[driver_id]["sprint_wins"] += 1
-            # No se cuentan podios en sprints
-
-            if team_id not in team_stats:
-                team_stats[team_id] = {
-                    "race_wins": 0, "sprint_wins": 0, "podiums": 0, 
-                    "total_points": 0, "fastest_laps": 0
-                }
-            team_stats[team_id]["total_points"] += result["points"]
-            if position == 1:
-                team_stats[team_id]["sprint_wins"] += 1
-            # No se cuentan podios en sprints
-
-        # Procesar resultados de clasificación
-        qualifying_results = fetch_qualifying_results(i)
-        for result in qualifying_results:
-            driver_id = result["driver_id"]
-            position = result["position"]
-            
-            if driver_id not in driver_stats:
-                driver_stats[driver_id] = {
-                    "race_wins": 0, "sprint_wins": 0, "podiums": 0, "poles": 0, 
-                    "total_points": 0, "fastest_laps": 0
-                }
-            if position == 1:
-                driver_stats[driver_id]["poles"] += 1
-
-    # Actualizar driver_statistics en Supabase (solo generales)
-    driver_standings, _ = fetch_standings()
-    for driver_id, stats in driver_stats.items():
+            positions = counts.setdefault(result[entity], {})
+            positions[result["position"]] = positions.get(result["position"], 0) + 1
+        cumulative.append({key: dict(positions) for key, positions in counts.items()})
+    return cumulative
+
+def load_finishes(data):
+    """Conteos de puestos leídos de JSON, con las claves de nuevo como enteros"""
+    return {int(key): {int(position): count for position, count in positions.items()}
+            for key, positions in data.items()}
+
+def load_sync_state():
+    """Leer el estado de sincronización incremental (marca de ronda y contadores por temporada)"""
+    try:
+        with open(SYNC_STATE_PATH, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_json_atomic(path, data):
+    """Escribir un fichero JSON de forma atómica"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+# Varias temporadas pueden guardar su estado a la vez durante un backfill
+sync_state_lock = threading.Lock()
+
+def save_season_state(season, season_state):
+    """Guardar el estado de sincronización de una temporada sin pisar el de las demás"""
+    with sync_state_lock:
+        state = load_sync_state()
+        state[str(season)] = season_state
+        save_json_atomic(SYNC_STATE_PATH, state)
+
+CHECKPOINT_DIR = os.getenv("F1_CHECKPOINT_DIR", ".cache/checkpoints")
+# Un checkpoint más antiguo se descarta: los datos de la API pueden haber cambiado
+CHECKPOINT_MAX_AGE = timedelta(hours=int(os.getenv("F1_CHECKPOINT_MAX_AGE_HOURS", "12")))
+# Formato del checkpoint; uno de otra versión (p. ej. sin los puestos para el desempate) se descarta
+CHECKPOINT_VERSION = 3
+
+class RunCheckpoint:
+    """Progreso de una sincronización de temporada para reanudarla tras un fallo.
+
+    Guarda en un fichero local las etapas terminadas (con lo que necesitan las
+    siguientes, como el calendario o los contadores agregados), las rondas ya
+    descargadas y resueltas y los conjuntos de temporada completos. Se borra
+    cuando la sincronización termina bien.
+    """
+
+    def __init__(self, season, full=False, resume=True):
+        self.path = os.path.join(CHECKPOINT_DIR, f"{season}.json")
+        self._lock = threading.Lock()
+        data = self._load() if resume else None
+        if (data is None or data.get("version") != CHECKPOINT_VERSION or data.get("full") != full
+                or datetime.now(UTC) - datetime.fromisoformat(data["created_at"]) > CHECKPOINT_MAX_AGE):
+            data = {"version": CHECKPOINT_VERSION, "season": season, "full": full,
+                    "created_at": datetime.now(UTC).isoformat(), "stages": {}, "rounds": {}, "datasets": []}
+        elif data["stages"] or data["rounds"]:
+            print(f"Reanudando {season}: etapas completadas {sorted(data['stages']) or '-'}, "
+                  f"{len(data['rounds'])} rondas ya descargadas.")
+        self.data = data
+
+    def _load(self):
         try:
-            existing = supabase.table("driver_statistics")\
-                .select("id")\
-                .eq("driver_id", driver_id)\
-                .eq("season_year", 2025)\
-                .is_("race_id", "null")\
-                .execute()
-            
-            data = {
-                "driver_id": driver_id,
-                "race_id": None,
-                "season_year": 2025,
-                "race_wins": stats["race_wins"],
-                "sprint_wins": stats["sprint_wins"],
-                "podiums": stats["podiums"],
-                "poles": stats["poles"],
-                "total_points": stats["total_points"],
-                "fastest_laps": stats["fastest_laps"],
-                "position": next((s["position"] for s in driver_standings if s["driver_id"] == driver_id), 0),
-                "updated_at": datetime.now(UTC).isoformat()
-            }
-            if existing.data:
-                supabase.table("driver_statistics")\
-                    .update(data)\
-                    .eq("driver_id", driver_id)\
-                    .eq("season_year", 2025)\
-                    .is_("race_id", "null")\
-                    .execute()
-            else:
-                supabase.table("driver_statistics").insert(data).execute()
-        except Exception as e:
-            print(f"Error al actualizar estadísticas del piloto {driver_id}: {e}")
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def done(self, stage):
+        return stage in self.data["stages"]
+
+    def get(self, stage):
+        return self.data["stages"][stage]
+
+    def complete(self, stage, value=None):
+        """Marcar una etapa como terminada y guardar"""
+        with self._lock:
+            self.data["stages"][stage] = value
+        self.save()
+
+    def fetched_rounds(self):
+        """Pares (ronda, endpoint) ya descargados"""
+        with self._lock:
+            return {(int(key.split(":")[0]), key.split(":")[1]) for key in self.data["rounds"]}
+
+    def round_rows(self, round_number, endpoint):
+        return self.data["rounds"].get(f"{round_number}:{endpoint}")
+
+    def add_rows(self, round_number, endpoint, rows):
+        """Anotar las filas resueltas de una ronda; se guardan con la siguiente escritura"""
+        with self._lock:
+            self.data["rounds"][f"{round_number}:{endpoint}"] = rows
+
+    def datasets_done(self):
+        return set(self.data["datasets"])
 
-    # Actualizar team_statistics en Supabase (solo generales)
-    _, team_standings = fetch_standings()
-    for team_id, stats in team_stats.items():
+    def finish_dataset(self, endpoint):
+        """Marcar un endpoint de temporada como descargado por completo"""
+        with self._lock:
+            self.data["datasets"].append(endpoint)
+        self.save()
+
+    def save(self):
+        with self._lock:
+            save_json_atomic(self.path, self.data)
+
+    def clear(self):
         try:
-            existing = supabase.table("team_statistics")\
-                .select("id")\
-                .eq("team_id", team_id)\
-                .eq("season_year", 2025)\
-                .is_("race_id", "null")\
-                .execute()
-            
-            data = {
-                "team_id": team_id,
-                "race_id": None,
-                "season_year": 2025,
-                "race_wins": stats["race_wins"],
-                "sprint_wins": stats["sprint_wins"],
-                "podiums": stats["podiums"],
-                "total_points": stats["total_points"],
-                "fastest_laps": stats["fastest_laps"],
-                "position": next((s["position"] for s in team_standings if s["team_id"] == team_id), 0),
-                "updated_at": datetime.now(UTC).isoformat()
-            }
-            if existing.data:
-                supabase.table("team_statistics")\
-                    .update(data)\
-                    .eq("team_id", team_id)\
-                    .eq("season_year", 2025)\
-                    .is_("race_id", "null")\
-                    .execute()
-            else:
-                supabase.table("team_statistics").insert(data).execute()
-        except Exception as e:
-            print(f"Error al actualizar estadísticas del equipo {team_id}: {e}")
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+# Espejo local en SQLite de lo descargado, junto a la caché para persistirlo entre ejecuciones.
+# Con F1_MIRROR_PATH vacío se desactiva
+MIRROR_PATH = os.getenv("F1_MIRROR_PATH", ".cache/mirror.sqlite3")
+
+MIRROR_SCHEMA = """
+CREATE TABLE IF NOT EXISTS calendar (
+    season INTEGER NOT NULL, round INTEGER NOT NULL, race_name TEXT NOT NULL, row TEXT NOT NULL,
+    PRIMARY KEY (season, round)
+);
+-- Rondas cuya descarga se ha registrado, aunque no tuvieran resultados
+CREATE TABLE IF NOT EXISTS rounds (
+    season INTEGER NOT NULL, round INTEGER NOT NULL, PRIMARY KEY (season, round)
+);
+-- Filas de carrera, sprint y clasificación con los IDs ya resueltos
+CREATE TABLE IF NOT EXISTS results (
+    season INTEGER NOT NULL, round INTEGER NOT NULL, dataset TEXT NOT NULL,
+    driver_id INTEGER NOT NULL, team_id INTEGER, race_id INTEGER NOT NULL,
+    position INTEGER NOT NULL, points INTEGER NOT NULL DEFAULT 0, fastest_lap INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS results_season_idx ON results (season, round);
+CREATE TABLE IF NOT EXISTS standings (
+    season INTEGER NOT NULL, kind TEXT NOT NULL, entity_id INTEGER NOT NULL,
+    position INTEGER NOT NULL, points INTEGER NOT NULL,
+    PRIMARY KEY (season, kind, entity_id)
+);
+-- Última versión de cada fila enviada a Supabase, para enviar solo el diff
+CREATE TABLE IF NOT EXISTS pushed (
+    tbl TEXT NOT NULL, season INTEGER NOT NULL, key TEXT NOT NULL, row TEXT NOT NULL,
+    PRIMARY KEY (tbl, season, key)
+);
+"""
+
+# Contadores acumulados de cada piloto o equipo tras cada ronda registrada, desde la
+# ronda en que aparece por primera vez. Las definiciones son las de accumulate_round:
+# un cambio en una de ellas (p. ej. qué cuenta como podio) debe hacerse en los dos sitios
+MIRROR_CUMULATIVE_SQL = """
+WITH events AS (
+    SELECT round, {entity} AS entity_id, dataset, position, points, fastest_lap
+    FROM results WHERE season = :season AND dataset IN ({datasets})
+),
+first_seen AS (
+    SELECT entity_id, MIN(round) AS first_round FROM events GROUP BY entity_id
+),
+per_round AS (
+    SELECT entity_id, round,
+           SUM(dataset = 'results' AND position = 1) AS race_wins,
+           SUM(dataset = 'sprint' AND position = 1) AS sprint_wins,
+           SUM(dataset = 'results' AND position <= 3) AS podiums,
+           SUM(dataset = 'qualifying' AND position = 1) AS poles,
+           SUM(CASE WHEN dataset IN ('results', 'sprint') THEN points ELSE 0 END) AS total_points,
+           SUM(dataset = 'results' AND fastest_lap) AS fastest_laps
+    FROM events GROUP BY entity_id, round
+)
+SELECT r.round, f.entity_id,
+       SUM(COALESCE(p.race_wins, 0)) OVER w AS race_wins,
+       SUM(COALESCE(p.sprint_wins, 0)) OVER w AS sprint_wins,
+       SUM(COALESCE(p.podiums, 0)) OVER w AS podiums,
+       SUM(COALESCE(p.poles, 0)) OVER w AS poles,
+       SUM(COALESCE(p.total_points, 0)) OVER w AS total_points,
+       SUM(COALESCE(p.fastest_laps, 0)) OVER w AS fastest_laps
+FROM first_seen AS f
+JOIN rounds AS r ON r.season = :season AND r.round >= f.first_round
+LEFT JOIN per_round AS p ON p.entity_id = f.entity_id AND p.round = r.round
+WINDOW w AS (PARTITION BY f.entity_id ORDER BY r.round)
+ORDER BY r.round, f.entity_id
+"""
+
+class LocalMirror:
+    """Copia local en SQLite del calendario, los resultados y las clasificaciones descargados.
+
+    Permite recalcular las estadísticas con SQL sin tráfico con la API ni con
+    Supabase (ver recompute_statistics) y guarda la última versión enviada de cada
+    fila de estadísticas para enviar después solo las que cambian. La base se abre
+    en el primer uso y se comparte entre hilos con un lock.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            if self._conn is None:
+                import sqlite3
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._conn = sqlite3.connect(self.path, check_same_thread=False)
+                self._conn.executescript(MIRROR_SCHEMA)
+            with self._conn:
+                yield self._conn
 
-def update_database():
-    """Actualizar las tablas en Supabase"""
+    def store_calendar(self, season, races):
+        if not self.enabled:
+            return
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM calendar WHERE season = ?", (season,))
+            conn.executemany("INSERT INTO calendar VALUES (?, ?, ?, ?)",
+                             [(season, round_number, race["race_name"], json.dumps(race))
+                              for round_number, race in enumerate(races, 1)])
+
+    def store_results(self, season, first_round, round_results):
+        """Sustituir las rondas desde ``first_round`` por las filas (carrera, sprint, clasificación) resueltas"""
+        if not self.enabled or not round_results:
+            return
+        last_round = first_round + len(round_results) - 1
+        rows = [(season, round_number, endpoint, row["driver_id"], row.get("team_id"), row["race_id"],
+                 row["position"], row.get("points", 0), int(row.get("fastest_lap", False)))
+                for round_number, results in enumerate(round_results, first_round)
+                for (endpoint, _, _, _), dataset_rows in zip(RESULT_DATASETS, results)
+                for row in dataset_rows]
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM results WHERE season = ? AND round BETWEEN ? AND ?",
+                         (season, first_round, last_round))
+            conn.executemany("INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            conn.executemany("INSERT OR IGNORE INTO rounds VALUES (?, ?)",
+                             [(season, round_number) for round_number in range(first_round, last_round + 1)])
+
+    def store_standings(self, season, driver_standings, team_standings):
+        if not self.enabled:
+            return
+        rows = ([(season, "driver", s["driver_id"], s["position"], s["total_points"]) for s in driver_standings]
+                + [(season, "team", s["team_id"], s["position"], s["total_points"]) for s in team_standings])
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM standings WHERE season = ?", (season,))
+            conn.executemany("INSERT INTO standings VALUES (?, ?, ?, ?, ?)", rows)
+
+    def statistics_rows(self, season):
+        """Filas de driver_statistics y team_statistics (temporada y rondas) calculadas con SQL"""
+        with self._transaction() as conn:
+            recorded = [round_number for (round_number,) in conn.execute(
+                "SELECT round FROM rounds WHERE season = ? ORDER BY round", (season,))]
+            if not recorded or recorded != list(range(1, len(recorded) + 1)):
+                raise RuntimeError(f"El espejo local no tiene todas las rondas de {season}; "
+                                   f"ejecuta 'python main.py --season {season} --full stats' para completarlo.")
+            race_ids = dict(conn.execute(
+                "SELECT round, MIN(race_id) FROM results WHERE season = ? AND dataset = 'results' GROUP BY round",
+                (season,)))
+            standings = {(kind, entity_id): position for kind, entity_id, position in conn.execute(
+                "SELECT kind, entity_id, position FROM standings WHERE season = ?", (season,))}
+            race_results = {round_number: [] for round_number in recorded}
+            for round_number, driver_id, team_id, position in conn.execute(
+                    "SELECT round, driver_id, team_id, position FROM results WHERE season = ? AND dataset = 'results'",
+                    (season,)):
+                race_results[round_number].append({"driver_id": driver_id, "team_id": team_id, "position": position})
+            cumulative = {}
+            for kind, entity, datasets, counters in (
+                    ("driver", "driver_id", "'results', 'sprint', 'qualifying'", DRIVER_COUNTERS),
+                    ("team", "team_id", "'results', 'sprint'", TEAM_COUNTERS)):
+                by_round = cumulative[kind] = {round_number: {} for round_number in recorded}
+                query = MIRROR_CUMULATIVE_SQL.format(entity=entity, datasets=datasets)
+                for round_number, entity_id, *values in conn.execute(query, {"season": season}):
+                    stats = dict(zip(DRIVER_COUNTERS, values))
+                    by_round[round_number][entity_id] = {counter: stats[counter] for counter in counters}
+
+        rounds = [(race_results[round_number], (), ()) for round_number in recorded]
+        finishes = {kind: dict(zip(recorded, finishing_counts({}, rounds, f"{kind}_id"))) for kind in ("driver", "team")}
+        driver_rows, team_rows = [], []
+        for round_number, race_id in sorted(race_ids.items()):
+            drivers, teams = round_snapshot_rows(season, race_id, cumulative["driver"][round_number],
+                                                 cumulative["team"][round_number],
+                                                 finishes["driver"][round_number], finishes["team"][round_number])
+            driver_rows.extend(drivers)
+            team_rows.extend(teams)
+        drivers, teams = cumulative["driver"][recorded[-1]], cumulative["team"][recorded[-1]]
+        driver_rows[:0] = [driver_statistics_row(driver_id, None, season, stats, standings.get(("driver", driver_id), 0))
+                           for driver_id, stats in drivers.items()]
+        team_rows[:0] = [team_statistics_row(team_id, None, season, stats, standings.get(("team", team_id), 0))
+                         for team_id, stats in teams.items()]
+        return driver_rows, team_rows
+
+    def changed_rows(self, table, season, rows, key_columns):
+        """Filas distintas de la última versión enviada a Supabase (todas si no hay registro)"""
+        if not self.enabled:
+            return list(rows)
+        with self._transaction() as conn:
+            pushed = dict(conn.execute("SELECT key, row FROM pushed WHERE tbl = ? AND season = ?", (table, season)))
+        return [row for row in rows
+                if pushed.get(json.dumps([row[column] for column in key_columns])) != json.dumps(row, sort_keys=True)]
+
+    def record_pushed(self, table, season, rows, key_columns):
+        """Anotar filas como ya enviadas a Supabase"""
+        if not self.enabled or not rows:
+            return
+        with self._transaction() as conn:
+            conn.executemany("INSERT OR REPLACE INTO pushed VALUES (?, ?, ?, ?)",
+                             [(table, season, json.dumps([row[column] for column in key_columns]),
+                               json.dumps(row, sort_keys=True)) for row in rows])
+
+mirror = LocalMirror(MIRROR_PATH)
+
+def start_statistics(season, races, full=False, checkpoint=None):
+    """Preparar la agregación de estadísticas y lanzar la descarga de resultados en segundo plano.
+
+    En modo incremental parte de los contadores guardados hasta la última ronda
+    asentada y solo descarga las rondas posteriores; ``full`` recalcula desde la ronda 1.
+    Con ``checkpoint`` no se vuelve a pedir lo descargado en un intento anterior.
+    Devuelve (última ronda procesada, contadores de pilotos, de equipos, stream de
+    resultados, conteos de puestos de pilotos y equipos).
+    """
+    require_calendar(season, races)
+    season_state = {} if full else load_sync_state().get(str(season), {})
+    last_round = season_state.get("last_round", 0)
+    if last_round > len(races):
+        print(f"La marca de sincronización ({last_round}) supera el calendario. Recalculando desde la ronda 1.")
+        last_round = 0
+    if last_round and "driver_finishes" not in season_state:
+        print("El estado guardado no tiene los puestos para el desempate. Recalculando desde la ronda 1.")
+        last_round = 0
+
+    driver_stats = {}
+    team_stats = {}
+    finishes = ({}, {})
+    if last_round:
+        driver_stats = {int(driver_id): stats for driver_id, stats in season_state["driver_stats"].items()}
+        team_stats = {int(team_id): stats for team_id, stats in season_state["team_stats"].items()}
+        finishes = (load_finishes(season_state["driver_finishes"]), load_finishes(season_state["team_finishes"]))
+        print(f"Modo incremental: rondas 1-{last_round} ya procesadas, descargando desde la ronda {last_round + 1}.")
+
+    if last_round:
+        skip = checkpoint.fetched_rounds() if checkpoint is not None else frozenset()
+        stream = stream_round_races(season, races[last_round:], first_round=last_round + 1, skip=skip)
+    else:
+        # Sincronización completa: endpoints de temporada paginados
+        skip = checkpoint.datasets_done() if checkpoint is not None else frozenset()
+        stream = stream_season_races(season, races, skip=skip)
+    return last_round, driver_stats, team_stats, stream, finishes
+
+def rank_positions(stats, finishes=None):
+    """Posición de cada piloto o equipo por puntos acumulados, con el desempate del reglamento.
+
+    A igualdad de puntos gana quien tiene más victorias en carrera, luego más
+    segundos puestos, y así sucesivamente; ``finishes`` son esos conteos, como los
+    de finishing_counts. Si todo coincide decide el id.
+    """
+    finishes = finishes or {}
+    depth = max((position for positions in finishes.values() for position in positions), default=1)
+
+    def sort_key(key):
+        positions = finishes.get(key, {})
+        return (-stats[key]["total_points"], -stats[key]["race_wins"],
+                *(-positions.get(position, 0) for position in range(2, depth + 1)), key)
+
+    order = sorted(stats, key=sort_key)
+    return {key: position for position, key in enumerate(order, 1)}
+
+def driver_statistics_row(driver_id, race_id, season, stats, position):
+    return {
+        "driver_id": driver_id,
+        "race_id": race_id,
+        "season_year": season,
+        "race_wins": stats["race_wins"],
+        "sprint_wins": stats["sprint_wins"],
+        "podiums": stats["podiums"],
+        "poles": stats["poles"],
+        "total_points": stats["total_points"],
+        "fastest_laps": stats["fastest_laps"],
+        "position": position
+    }
+
+def team_statistics_row(team_id, race_id, season, stats, position):
+    return {
+        "team_id": team_id,
+        "race_id": race_id,
+        "season_year": season,
+        "race_wins": stats["race_wins"],
+        "sprint_wins": stats["sprint_wins"],
+        "podiums": stats["podiums"],
+        "total_points": stats["total_points"],
+        "fastest_laps": stats["fastest_laps"],
+        "position": position
+    }
+
+def round_snapshot_rows(season, race_id, driver_stats, team_stats, driver_finishes=None, team_finishes=None):
+    """Filas acumuladas tras una ronda (race_id de la ronda) con la posición calculada localmente"""
+    driver_positions = rank_positions(driver_stats, driver_finishes)
+    team_positions = rank_positions(team_stats, team_finishes)
+    return (
+        [driver_statistics_row(driver_id, race_id, season, stats, driver_positions[driver_id])
+         for driver_id, stats in driver_stats.items()],
+        [team_statistics_row(team_id, race_id, season, stats, team_positions[team_id])
+         for team_id, stats in team_stats.items()],
+    )
+
+def update_statistics(season, races, full=False, prefetched=None, checkpoint=None):
+    """Actualizar estadísticas de pilotos y equipos basadas en resultados de carreras, sprint y clasificación.
+
+    Además de la fila de temporada (``race_id`` nulo) se escribe una fila acumulada
+    por ronda con resultados, calculada en la misma pasada; en modo incremental
+    solo se añaden las de las rondas nuevas.
+
+    ``prefetched`` es lo que devolvió start_statistics cuando la descarga se lanzó
+    antes, para solaparla con otras escrituras; si no, se lanza aquí. Con
+    ``checkpoint`` se saltan la descarga, la agregación y las escrituras que ya
+    terminaron en un intento anterior.
+    """
+    if checkpoint is not None and checkpoint.done("aggregate"):
+        aggregate = checkpoint.get("aggregate")
+        driver_stats = {int(driver_id): stats for driver_id, stats in aggregate["driver_stats"].items()}
+        team_stats = {int(team_id): stats for team_id, stats in aggregate["team_stats"].items()}
+        watermark = aggregate["watermark"]
+        snapshot = aggregate["snapshot"]
+        driver_round_rows, team_round_rows = aggregate["round_rows"]
+    else:
+        last_round, driver_stats, team_stats, stream, (driver_finishes, team_finishes) = (
+            prefetched or start_statistics(season, races, full=full, checkpoint=checkpoint))
+        pending_races = races[last_round:]
+        with metrics.stage("fetch_results"):
+            round_results = collect_round_results(stream, last_round + 1, len(races), checkpoint)
+        mirror.store_results(season, last_round + 1, round_results)
+
+        # La marca solo avanza sobre rondas consecutivas asentadas y con resultados de carrera
+        with metrics.stage("aggregate"):
+            watermark = last_round
+            snapshot = (copy.deepcopy(driver_stats), copy.deepcopy(team_stats), driver_finishes, team_finishes)
+            cumulative = aggregate_rounds(driver_stats, team_stats, round_results)
+            if cumulative:
+                driver_stats, team_stats = cumulative[-1]
+            driver_round_rows, team_round_rows = [], []
+            for round_number, race, results, (drivers_after, teams_after), drivers_finished, teams_finished in zip(
+                    range(last_round + 1, len(races) + 1), pending_races, round_results, cumulative,
+                    finishing_counts(driver_finishes, round_results, "driver_id"),
+                    finishing_counts(team_finishes, round_results, "team_id")):
+                race_id = id_resolver.race_id(race["race_name"], season) if results[0] else None
+                if race_id is not None:
+                    driver_rows, team_rows = round_snapshot_rows(season, race_id, drivers_after, teams_after,
+                                                                 drivers_finished, teams_finished)
+                    driver_round_rows.extend(driver_rows)
+                    team_round_rows.extend(team_rows)
+                if watermark == round_number - 1 and results[0] and round_is_settled(race):
+                    watermark = round_number
+                    snapshot = (drivers_after, teams_after, drivers_finished, teams_finished)
+        if checkpoint is not None:
+            checkpoint.complete("aggregate", {"driver_stats": driver_stats, "team_stats": team_stats,
+                                              "watermark": watermark, "snapshot": snapshot,
+                                              "round_rows": [driver_round_rows, team_round_rows]})
+
+    # Actualizar driver_statistics y team_statistics en Supabase (temporada y rondas) a la vez
+    with ParallelWriter() as writer:
+        if checkpoint is not None and checkpoint.done("driver_statistics"):
+            print(f"driver_statistics {season} ya escrita en un intento anterior.")
+        else:
+            writer.submit("driver_statistics", write_driver_statistics, season, driver_stats, driver_round_rows, checkpoint)
+        if checkpoint is not None and checkpoint.done("team_statistics"):
+            print(f"team_statistics {season} ya escrita en un intento anterior.")
+        else:
+            writer.submit("team_statistics", write_team_statistics, season, team_stats, team_round_rows, checkpoint)
+
+    save_season_state(season, {"last_round": watermark, "driver_stats": snapshot[0], "team_stats": snapshot[1],
+                               "driver_finishes": snapshot[2], "team_finishes": snapshot[3]})
+    print(f"Marca de sincronización de {season} guardada en la ronda {watermark}.")
+
+def write_driver_statistics(season, driver_stats, round_rows=(), checkpoint=None):
+    """Escribir las estadísticas de pilotos de una temporada: la fila general y las de cada ronda"""
+    with metrics.stage("standings"):
+        standings = standings_service.get(season)
+    driver_rows = [
+        driver_statistics_row(driver_id, None, season, stats, standings.driver_position(driver_id))
+        for driver_id, stats in driver_stats.items()
+    ] + list(round_rows)
     try:
-        # Actualizar calendario
-        races = fetch_races()
-        for race in races:
-            try:
-                existing = supabase.table("calendar")\
-                    .select("id")\
-                    .eq("race_name", race["race_name"])\
-                    .eq("season_year", race["season_year"])\
-                    .execute()
-                
-                if existing.data:
-                    supabase.table("calendar")\
-                        .update(race)\
-                        .eq("race_name", race["race_name"])\
-                        .eq("season_year", race["season_year"])\
-                        .execute()
-                else:
-                    supabase.table("calendar").insert(race).execute()
-            except Exception as e:
-                print(f"Error al procesar carrera {race['race_name']}: {e}")
-                raise
+        with metrics.stage("write_driver_statistics"):
+            inserted, updated, unchanged = upsert_rows("driver_statistics", driver_rows, STATISTICS_KEYS["driver_statistics"], season_year=season)
+        mirror.record_pushed("driver_statistics", season, driver_rows, STATISTICS_KEYS["driver_statistics"])
+        print(f"driver_statistics {season}: {inserted} insertadas, {updated} actualizadas, {unchanged} sin cambios.")
+    except Exception as e:
+        print(f"Error al actualizar estadísticas de pilotos: {e}")
+        raise
+    if checkpoint is not None:
+        checkpoint.complete("driver_statistics")
 
-        print("Tabla calendar actualizada.")
+def write_team_statistics(season, team_stats, round_rows=(), checkpoint=None):
+    """Escribir las estadísticas de equipos de una temporada: la fila general y las de cada ronda"""
+    with metrics.stage("standings"):
+        standings = standings_service.get(season)
+    team_rows = [
+        team_statistics_row(team_id, None, season, stats, standings.team_position(team_id))
+        for team_id, stats in team_stats.items()
+    ] + list(round_rows)
+    try:
+        with metrics.stage("write_team_statistics"):
+            inserted, updated, unchanged = upsert_rows("team_statistics", team_rows, STATISTICS_KEYS["team_statistics"], season_year=season)
+        mirror.record_pushed("team_statistics", season, team_rows, STATISTICS_KEYS["team_statistics"])
+        print(f"team_statistics {season}: {inserted} insertadas, {updated} actualizadas, {unchanged} sin cambios.")
+    except Exception as e:
+        print(f"Error al actualizar estadísticas de equipos: {e}")
+        raise
+    if checkpoint is not None:
+        checkpoint.complete("team_statistics")
 
-        # Actualizar pilotos
-        drivers = fetch_drivers()
-        for driver in drivers:
-            try:
-                existing = supabase.table("drivers")\
-                    .select("id")\
-                    .eq("driver_code", driver["driver_code"])\
-                    .execute()
-                
-                if existing.data:
-                    supabase.table("drivers")\
-                        .update(driver)\
-                        .eq("driver_code", driver["driver_code"])\
-                        .execute()
-                else:
-                    supabase.table("drivers").insert(driver).execute()
-            except Exception as e:
-                print(f"Error al procesar piloto {driver['driver_code']}: {e}")
-                raise
+# Filas de vueltas y paradas por escritura; la memoria no depende de la duración de la carrera
+LAP_BATCH_SIZE = int(os.getenv("LAP_BATCH_SIZE", "2000"))
+# Páginas de la API descargadas por delante de la escritura
+LAP_PAGES_AHEAD = 4
+
+def duration_ms(value):
+    """Convertir un tiempo como "1:37.284" o "26.898" a milisegundos, o None si no es válido"""
+    if not value:
+        return None
+    minutes, _, seconds = value.rpartition(":")
+    try:
+        return round((int(minutes or 0) * 60 + float(seconds)) * 1000)
+    except ValueError:
+        return None
+
+def stream_round_rows(season, round_number, endpoint, rows_key, to_rows):
+    """Descargar en segundo plano, página a página, un endpoint voluminoso de una ronda.
+
+    Entrega la lista de filas de cada página convertidas con ``to_rows``; como
+    mucho LAP_PAGES_AHEAD páginas esperan en memoria a ser escritas.
+    """
+    def produce(put):
+        url = f"{season_url(season)}/{round_number}/{endpoint}.json"
+        for page in iter_pages(url, cached=False):
+            put([row for race in page["RaceTable"]["Races"] for row in to_rows(race.get(rows_key, []))])
+
+    return PipelineStage(produce, maxsize=LAP_PAGES_AHEAD)
+
+def iter_lap_times(season, round_number, race_id):
+    """Filas de lap_times de una carrera, página a página"""
+    def to_rows(laps):
+        # Una vuelta puede quedar partida entre dos páginas; cada tiempo es una fila
+        return [{
+            "race_id": race_id,
+            "driver_id": id_resolver.driver_id(timing["driverId"]),
+            "season_year": season,
+            "lap_number": int(lap["number"]),
+            "position": int(timing["position"]) if timing.get("position") else None,
+            "lap_time": timing.get("time"),
+            "milliseconds": duration_ms(timing.get("time")),
+        } for lap in laps for timing in lap.get("Timings", [])]
+
+    for rows in stream_round_rows(season, round_number, "laps", "Laps", to_rows):
+        yield from rows
+
+def iter_pit_stops(season, round_number, race_id):
+    """Filas de pit_stops de una carrera, página a página"""
+    def to_rows(stops):
+        return [{
+            "race_id": race_id,
+            "driver_id": id_resolver.driver_id(stop["driverId"]),
+            "season_year": season,
+            "stop_number": int(stop["stop"]),
+            "lap_number": int(stop["lap"]),
+            "time_of_day": stop.get("time"),
+            "duration": stop.get("duration"),
+            "milliseconds": duration_ms(stop.get("duration")),
+        } for stop in stops]
+
+    for rows in stream_round_rows(season, round_number, "pitstops", "PitStops", to_rows):
+        yield from rows
+
+def write_batches(table, rows, batch_size=LAP_BATCH_SIZE):
+    """Insertar un iterable de filas en lotes sin materializarlo entero; devuelve las filas escritas.
+
+    Los lotes se escriben en paralelo con ParallelWriter, que limita también los
+    que hay en memoria. Las filas sin piloto conocido se descartan.
+    """
+    batch, written, skipped = [], 0, 0
+    with ParallelWriter() as writer:
+        for row in rows:
+            if row["driver_id"] is None:
+                skipped += 1
+                continue
+            batch.append(row)
+            if len(batch) >= batch_size:
+                writer.submit(f"{table} lote {written}", get_storage().insert_rows, table, batch)
+                written += len(batch)
+                batch = []
+        if batch:
+            writer.submit(f"{table} lote {written}", get_storage().insert_rows, table, batch)
+            written += len(batch)
+    if skipped:
+        print(f"Advertencia: {skipped} filas de {table} con pilotos desconocidos descartadas.")
+    return written
 
-        print("Tabla drivers actualizada.")
+# tabla, generador de filas y etiqueta
+LAP_DATASETS = (
+    ("lap_times", iter_lap_times, "vueltas"),
+    ("pit_stops", iter_pit_stops, "paradas"),
+)
+# Registro de las carreras cargadas por tabla, también las que la API no tiene (paradas antes de 2011)
+LAP_LOADS_TABLE = "lap_data_loads"
 
-        # Actualizar equipos
-        teams = fetch_teams()
-        for team in teams:
+def update_lap_data(season, races):
+    """Cargar vueltas y paradas de las carreras asentadas que aún no están en Supabase.
+
+    Cada carrera cargada se anota en lap_data_loads con sus filas, aunque sean cero,
+    así que una sola lectura por temporada dice qué falta y las carreras sin datos
+    en la API no se vuelven a pedir. Cada carrera se escribe entera o no se escribe:
+    si falla a mitad, antes de anotarse, se borran sus filas.
+    """
+    loaded = None
+    for round_number, race in enumerate(races, 1):
+        if not round_is_settled(race):
+            continue
+        race_id = id_resolver.race_id(race["race_name"], season)
+        if race_id is None:
+            continue
+        if loaded is None:
+            loaded = {(row["race_id"], row["dataset"])
+                      for row in select_all(LAP_LOADS_TABLE, "race_id, dataset", season_year=season)}
+        for table, iterate, label in LAP_DATASETS:
+            if (race_id, table) in loaded:
+                continue
             try:
-                existing = supabase.table("teams")\
-                    .select("id")\
-                    .eq("team_name", team["team_name"])\
-                    .execute()
-                
-                if existing.data:
-                    supabase.table("teams")\
-                        .update(team)\
-                        .eq("team_name", team["team_name"])\
-                        .execute()
-                else:
-                    supabase.table("teams").insert(team).execute()
-            except Exception as e:
-                print(f"Error al procesar equipo {team['team_name']}: {e}")
+                with metrics.stage(f"write_{table}"):
+                    written = write_batches(table, iterate(season, round_number, race_id))
+                    get_storage().insert_rows(LAP_LOADS_TABLE, [{"race_id": race_id, "season_year": season,
+                                                                 "dataset": table, "row_count": written}])
+            except Exception:
+                get_storage().delete_rows(table, race_id=race_id)
                 raise
+            if written:
+                print(f"{table} {season} ronda {round_number}: {written} {label} insertadas.")
+
+# drivers y teams son compartidos entre temporadas: las escrituras de cada tabla no deben solaparse
+catalog_locks = {"drivers": threading.Lock(), "teams": threading.Lock()}
+
+def write_calendar(season, races, checkpoint=None):
+    """Escribir el calendario de una temporada y recargar después sus IDs"""
+    with metrics.stage("calendar"):
+        inserted, updated, unchanged = upsert_rows("calendar", races, NATURAL_KEYS["calendar"], season_year=season)
+        id_resolver.invalidate("calendar")
+    if checkpoint is not None:
+        checkpoint.complete("calendar", races)
+    print(f"Tabla calendar {season} actualizada ({inserted} insertadas, {updated} actualizadas, {unchanged} sin cambios).")
+
+def adopt_legacy_drivers(drivers):
+    """Completar driver_ref en las filas de drivers escritas antes de existir la columna.
+
+    Una fila sin driver_ref pasa a ser del piloto con su mismo código y nombre
+    completo. Si el nombre no coincide (el código era de otro piloto de otra época)
+    la fila se deja como está y el piloto se inserta aparte. Devuelve las filas adoptadas.
+    """
+    stored = select_all("drivers", "id, driver_ref, driver_code, first_name, last_name")
+    known = {row["driver_ref"] for row in stored}
+    legacy = {(row["driver_code"], row["first_name"], row["last_name"]): row["id"]
+              for row in stored if row["driver_ref"] is None}
+    adopted = []
+    for driver in drivers:
+        if driver["driver_ref"] in known:
+            continue
+        row_id = legacy.pop((driver["driver_code"], driver["first_name"], driver["last_name"]), None)
+        if row_id is not None:
+            adopted.append({"id": row_id, "driver_ref": driver["driver_ref"]})
+    if adopted:
+        upsert_rows("drivers", adopted, ("id",), insert_missing=False)
+    return len(adopted)
+
+def write_catalog(table, season, rows, checkpoint=None):
+    """Escribir los pilotos o equipos de una temporada en drivers o teams"""
+    with catalog_locks[table], metrics.stage(table):
+        if table == "drivers" and adopt_legacy_drivers(rows):
+            print(f"Pilotos de {season} enlazados con sus filas anteriores a driver_ref.")
+        inserted, updated, unchanged = upsert_rows(table, rows, NATURAL_KEYS[table])
+        id_resolver.invalidate(table)
+    if checkpoint is not None:
+        checkpoint.complete(table)
+    print(f"Tabla {table} actualizada para {season} ({inserted} insertadas, {updated} actualizadas, {unchanged} sin cambios).")
+
+def update_database(season=DEFAULT_SEASON, full=False, resume=True, laps=False):
+    """Actualizar las tablas en Supabase para una temporada.
+
+    Las descargas van por delante de las escrituras: pilotos y equipos se piden a
+    la API mientras se escribe el calendario, y los resultados se descargan en
+    segundo plano mientras se escriben calendar, drivers y teams, las tres en
+    paralelo con ParallelWriter. Su resolución de IDs espera a que esas tres tablas
+    estén escritas.
 
-        print("Tabla teams actualizada.")
+    Si un intento anterior falló, se reanuda desde su checkpoint sin repetir lo que
+    ya terminó; ``resume=False`` lo descarta y empieza de cero. Con ``laps`` se
+    cargan también las vueltas y paradas de las carreras que aún no las tienen.
+    """
+    checkpoint = RunCheckpoint(season, full=full, resume=resume)
+    statistics = None
+    try:
+        with ThreadPoolExecutor(max_workers=2) as executor, ParallelWriter() as writer:
+            drivers_future = None if checkpoint.done("drivers") else executor.submit(fetch_drivers, season)
+            teams_future = None if checkpoint.done("teams") else executor.submit(fetch_teams, season)
+
+            # Actualizar calendario
+            if checkpoint.done("calendar"):
+                races = checkpoint.get("calendar")
+            else:
+                races = require_calendar(season, fetch_races(season))
+                if not checkpoint.done("aggregate"):
+                    statistics = start_statistics(season, races, full=full, checkpoint=checkpoint)
+                writer.submit("calendar", write_calendar, season, races, checkpoint)
+            if statistics is None and not checkpoint.done("aggregate"):
+                statistics = start_statistics(season, races, full=full, checkpoint=checkpoint)
+
+            # Actualizar pilotos y equipos según llegan de la API
+            if drivers_future is not None:
+                writer.submit("drivers", write_catalog, "drivers", season, drivers_future.result(), checkpoint)
+            if teams_future is not None:
+                writer.submit("teams", write_catalog, "teams", season, teams_future.result(), checkpoint)
 
         # Actualizar estadísticas
-        update_statistics(races)
-        print("Tablas driver_statistics y team_statistics actualizadas.")
+        with metrics.stage("statistics"):
+            update_statistics(season, races, full=full, prefetched=statistics, checkpoint=checkpoint)
+        print(f"Tablas driver_statistics y team_statistics {season} actualizadas.")
+
+        if laps:
+            with metrics.stage("lap_data"):
+                update_lap_data(season, races)
+        checkpoint.clear()
 
     except Exception as e:
-        print(f"Error al actualizar la base de datos: {e}")
+        # Conservar lo descargado hasta el fallo para el siguiente intento
+        checkpoint.save()
+        print(f"Error al actualizar la base de datos ({season}): {e}")
         raise
+    finally:
+        if statistics is not None:
+            statistics[3].close()
+
+# Temporadas procesadas a la vez durante un backfill (comparten el limitador global)
+BACKFILL_WORKERS = int(os.getenv("BACKFILL_WORKERS", "2"))
+BACKFILL_CHECKPOINT_PATH = os.getenv("F1_BACKFILL_CHECKPOINT", ".cache/backfill_checkpoint.json")
+
+def load_backfill_checkpoint():
+    """Temporadas ya completadas por backfills anteriores"""
+    try:
+        with open(BACKFILL_CHECKPOINT_PATH, encoding="utf-8") as f:
+            return set(json.load(f).get("completed", []))
+    except (OSError, ValueError):
+        return set()
+
+def backfill(first_season, last_season, workers=BACKFILL_WORKERS, restart=False, laps=False):
+    """Cargar un rango de temporadas completas, reanudando desde el último checkpoint.
+
+    Cada temporada se descarga, escribe y libera antes de pasar a la siguiente, por
+    lo que la memoria depende del número de hilos y no del número de temporadas.
+    Todas las peticiones pasan por el mismo limitador de la API.
+    """
+    completed = set() if restart else load_backfill_checkpoint()
+    pending = [season for season in range(first_season, last_season + 1) if season not in completed]
+    if completed:
+        print(f"Backfill: {len(completed)} temporadas ya completadas, quedan {len(pending)}.")
+
+    checkpoint_lock = threading.Lock()
+    failed = []
+
+    def run_season(season):
+        update_database(season, full=True, resume=not restart, laps=laps)
+        with checkpoint_lock:
+            completed.add(season)
+            save_json_atomic(BACKFILL_CHECKPOINT_PATH, {"completed": sorted(completed)})
+        print(f"Backfill: temporada {season} completada.")
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(run_season, season): season for season in pending}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except RateLimitExceeded:
+                # Detener el resto: el checkpoint permite reanudar más tarde
+                for other in futures:
+                    other.cancel()
+                raise
+            except Exception as e:
+                print(f"Backfill: error en la temporada {futures[future]}: {e}")
+                failed.append(futures[future])
+
+    if failed:
+        raise RuntimeError(f"Backfill incompleto, temporadas con error: {sorted(failed)}")
+
+# Sesiones con resultados: columna de calendar, endpoint y duración prevista
+LIVE_SESSIONS = (
+    ("qualifying_time", "qualifying", timedelta(hours=1)),
+    ("sprint_race_time", "sprint", timedelta(hours=1)),
+    ("race_time", "results", timedelta(hours=2)),
+)
+# Margen tras el final previsto antes del primer sondeo
+LIVE_GRACE = timedelta(minutes=int(os.getenv("LIVE_GRACE_MINUTES", "10")))
+# Sesiones terminadas hace más de esto al arrancar se dejan a la sincronización programada
+LIVE_LOOKBACK = timedelta(hours=6)
+# Sondeo con backoff: intervalo inicial, máximo y tiempo total antes de rendirse (segundos)
+LIVE_POLL_INITIAL = 120
+LIVE_POLL_MAX = 900
+LIVE_POLL_TIMEOUT = 6 * 3600
+# Cada cuánto se relee el calendario mientras se espera a la próxima sesión (segundos)
+LIVE_CALENDAR_REFRESH = 3600
+
+def load_calendar(season, previous=None):
+    """Calendario de una temporada desde la API, en el orden de sus rondas (índice = ronda - 1).
+
+    La tabla calendar no guarda la ronda y ordenarla por fecha la desplaza si queda
+    una carrera cancelada o movida. Si la petición falla se sigue con ``previous``.
+    """
+    races = fetch_races(season)
+    if not races and previous:
+        print(f"Se mantiene el calendario de {season} leído antes.")
+        return previous
+    return require_calendar(season, races)
+
+def upcoming_sessions(races, processed, now):
+    """Sesiones pendientes como (hora de sondeo, ronda, endpoint), de la más próxima a la más lejana"""
+    sessions = []
+    for round_number, race in enumerate(races, 1):
+        for column, endpoint, duration in LIVE_SESSIONS:
+            start = parse_timestamp(race.get(column))
+            if start is None or (round_number, endpoint) in processed:
+                continue
+            wake_at = start + duration + LIVE_GRACE
+            if wake_at >= now - LIVE_LOOKBACK:
+                sessions.append((wake_at, round_number, endpoint))
+    return sorted(sessions)
+
+def poll_session(season, round_number, endpoint):
+    """Sondear el endpoint de una sesión con backoff hasta que publique resultados"""
+    delay = LIVE_POLL_INITIAL
+    deadline = time.monotonic() + LIVE_POLL_TIMEOUT
+    while True:
+        if fetch_round_race(season, round_number, endpoint) is not None:
+            return True
+        if time.monotonic() + delay > deadline:
+            print(f"Sin resultados de {endpoint} de la ronda {round_number} tras {LIVE_POLL_TIMEOUT // 3600} h. Se deja a la sincronización programada.")
+            return False
+        print(f"Resultados de {endpoint} de la ronda {round_number} aún no publicados. Reintentando en {delay} s.")
+        time.sleep(delay)
+        delay = min(LIVE_POLL_MAX, delay * 2)
+
+def live(season=DEFAULT_SEASON):
+    """Modo fin de semana: despertar tras cada sesión con resultados y sincronizarla.
+
+    Lee las horas de las sesiones del calendario de la API, duerme hasta el final
+    previsto de la siguiente clasificación, sprint o carrera, sondea solo su
+    endpoint hasta que aparecen los datos y lanza una sincronización incremental
+    de estadísticas, que descarga únicamente las rondas no asentadas.
+    """
+    processed = set()
+    races = None
+    while True:
+        races = load_calendar(season, races)
+        now = datetime.now(UTC)
+        sessions = upcoming_sessions(races, processed, now)
+        if not sessions:
+            print(f"No quedan sesiones pendientes en {season}.")
+            return
+
+        wake_at, round_number, endpoint = sessions[0]
+        wait = (wake_at - now).total_seconds()
+        if wait > 0:
+            print(f"Próxima sesión: {endpoint} de la ronda {round_number} ({races[round_number - 1]['race_name']}). Sondeo a las {wake_at.isoformat()}.")
+            time.sleep(min(wait, LIVE_CALENDAR_REFRESH))
+            continue
+
+        if poll_session(season, round_number, endpoint):
+            # La sesión puede haber cambiado la clasificación
+            standings_service.invalidate(season)
+            with metrics.stage("live_sync"):
+                update_statistics(season, races)
+            print(f"Sincronizados los resultados de {endpoint} de la ronda {round_number}.")
+        processed.add((round_number, endpoint))
+
+# Sincronización selectiva: cada comando hace solo las llamadas de su tabla
+
+def sync_calendar(season=DEFAULT_SEASON):
+    """Actualizar solo la tabla calendar de una temporada"""
+    write_calendar(season, require_calendar(season, fetch_races(season)))
+
+def sync_catalog(table, season=DEFAULT_SEASON):
+    """Actualizar solo la tabla drivers o teams con los de una temporada"""
+    fetch = fetch_drivers if table == "drivers" else fetch_teams
+    write_catalog(table, season, fetch(season))
+
+def refresh_standings(season=DEFAULT_SEASON):
+    """Actualizar la posición en el campeonato de las filas de temporada existentes.
+
+    Solo pide las dos clasificaciones y escribe la columna ``position`` de las filas
+    con ``race_id`` nulo: no descarga resultados, no recalcula contadores y no crea
+    filas para pilotos o equipos que aún no tienen estadísticas.
+    """
+    with metrics.stage("standings"):
+        snapshot = standings_service.get(season)
+    for table, standings, id_column in (("driver_statistics", snapshot.driver_standings, "driver_id"),
+                                        ("team_statistics", snapshot.team_standings, "team_id")):
+        rows = [{id_column: standing[id_column], "race_id": None, "season_year": season,
+                 "position": standing["position"]} for standing in standings]
+        with metrics.stage(f"write_{table}"):
+            _, updated, unchanged = upsert_rows(table, rows, STATISTICS_KEYS[table],
+                                                insert_missing=False, season_year=season)
+        print(f"{table} {season}: {updated} posiciones actualizadas, {unchanged} sin cambios.")
+
+def sync_statistics(season=DEFAULT_SEASON, full=False):
+    """Recalcular solo driver_statistics y team_statistics, sin escribir calendar, drivers ni teams"""
+    races = fetch_races(season)
+    with metrics.stage("statistics"):
+        update_statistics(season, races, full=full)
+    print(f"Tablas driver_statistics y team_statistics {season} actualizadas.")
+
+def recompute_statistics(season=DEFAULT_SEASON, dry_run=False):
+    """Recalcular las estadísticas de una temporada desde el espejo local y enviar solo el diff.
+
+    No pide nada a la API: los contadores se calculan con SQL sobre el espejo y se
+    comparan con la última versión enviada de cada fila. Solo las distintas llegan
+    a upsert_rows, así que sin cambios no hay tráfico con Supabase; con ``dry_run``
+    solo se informa de cuántas filas cambiarían.
+    """
+    with metrics.stage("mirror_recompute"):
+        driver_rows, team_rows = mirror.statistics_rows(season)
+    for table, rows in (("driver_statistics", driver_rows), ("team_statistics", team_rows)):
+        key_columns = STATISTICS_KEYS[table]
+        changed = mirror.changed_rows(table, season, rows, key_columns)
+        if dry_run or not changed:
+            print(f"{table} {season}: {len(changed)} de {len(rows)} filas distintas de lo enviado"
+                  f"{' (sin enviar)' if dry_run and changed else ''}.")
+            continue
+        with metrics.stage(f"write_{table}"):
+            inserted, updated, unchanged = upsert_rows(table, changed, key_columns, season_year=season)
+        mirror.record_pushed(table, season, changed, key_columns)
+        print(f"{table} {season}: {inserted} insertadas, {updated} actualizadas, {unchanged} sin cambios "
+              f"({len(rows) - len(changed)} ya enviadas sin leerlas).")
+
+def show_round_results(season, round_number):
+    """Imprimir los resultados publicados de una ronda; no lee ni escribe la base de datos"""
+    for endpoint, results_key, _, label in RESULT_DATASETS:
+        race_data = fetch_round_race(season, round_number, endpoint)
+        if race_data is None:
+            continue
+        race = Race.from_api(race_data)
+        print(f"{label.capitalize()} de {race.name} ({season}, ronda {round_number}):")
+        for result in map(Result.from_api, race_data.get(results_key, [])):
+            team = result.constructor.name if result.constructor else ""
+            points = f" {result.points:g} pts" if result.points else ""
+            fastest = " (vuelta rápida)" if result.fastest_lap else ""
+            print(f"  {result.position:>2}. {result.driver.code:<4} {result.driver.first_name} "
+                  f"{result.driver.last_name} - {team}{points}{fastest}")
 
 if __name__ == "__main__":
-    update_database()
-    print("Base de datos actualizada exitosamente.")
+    parser = argparse.ArgumentParser(description="Sincronizar datos de F1 de Jolpica con Supabase")
+    parser.add_argument("--season", type=int, default=DEFAULT_SEASON, help="temporada a sincronizar")
+    parser.add_argument("--full", action="store_true",
+                        help="recalcular las estadísticas desde la ronda 1 ignorando la marca incremental")
+    parser.add_argument("--no-resume", dest="resume", action="store_false",
+                        help="descartar el checkpoint de un intento fallido y empezar de cero")
+    parser.add_argument("--laps", action="store_true",
+                        help="cargar también vueltas y paradas de las carreras que aún no las tienen")
+    subparsers = parser.add_subparsers(dest="command")
+    backfill_parser = subparsers.add_parser("backfill", help="cargar un rango de temporadas completas")
+    backfill_parser.add_argument("first_season", type=int)
+    backfill_parser.add_argument("last_season", type=int)
+    backfill_parser.add_argument("--workers", type=int, default=BACKFILL_WORKERS,
+                                 help="temporadas procesadas en paralelo")
+    backfill_parser.add_argument("--restart", action="store_true",
+                                 help="ignorar el checkpoint y empezar desde la primera temporada")
+    subparsers.add_parser("live", help="esperar a cada sesión del fin de semana y sincronizarla al publicarse")
+    subparsers.add_parser("calendar", help="actualizar solo la tabla calendar")
+    subparsers.add_parser("drivers", help="actualizar solo la tabla drivers")
+    subparsers.add_parser("teams", help="actualizar solo la tabla teams")
+    results_parser = subparsers.add_parser("results", help="mostrar los resultados de una ronda sin escribir nada")
+    results_parser.add_argument("--round", dest="round_number", type=int, required=True, help="ronda a mostrar")
+    subparsers.add_parser("standings", help="actualizar solo la posición en el campeonato de pilotos y equipos")
+    subparsers.add_parser("stats", help="recalcular solo driver_statistics y team_statistics")
+    recompute_parser = subparsers.add_parser(
+        "recompute", help="recalcular las estadísticas desde el espejo local sin usar la API y enviar solo el diff")
+    recompute_parser.add_argument("--dry-run", action="store_true", help="informar del diff sin enviarlo")
+    parser.add_argument("--metrics-file", default=os.getenv("F1_METRICS_FILE"),
+                        help="guardar al final un informe JSON con tiempos y contadores")
+    parser.add_argument("--profile-stage", help="perfilar con cProfile una etapa (p. ej. aggregate)")
+    args = parser.parse_args()
+    metrics.profile_stage = args.profile_stage
+    try:
+        if args.command == "backfill":
+            backfill(args.first_season, args.last_season, workers=args.workers, restart=args.restart, laps=args.laps)
+        elif args.command == "live":
+            live(args.season)
+        elif args.command == "calendar":
+            sync_calendar(args.season)
+        elif args.command in ("drivers", "teams"):
+            sync_catalog(args.command, args.season)
+        elif args.command == "results":
+            show_round_results(args.season, args.round_number)
+        elif args.command == "standings":
+            refresh_standings(args.season)
+        elif args.command == "stats":
+            sync_statistics(args.season, full=args.full)
+        elif args.command == "recompute":
+            recompute_statistics(args.season, dry_run=args.dry_run)
+        else:
+            update_database(args.season, full=args.full, resume=args.resume, laps=args.laps)
+    except RateLimitExceeded as e:
+        print(f"Error 429: {e}")
+        sys.exit(429)
+    finally:
+        if args.metrics_file:
+            metrics.write(args.metrics_file)
+    if args.command != "results" and not getattr(args, "dry_run", False):
+        print("Base de datos actualizada exitosamente.")
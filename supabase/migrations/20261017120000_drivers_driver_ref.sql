@@ -0,0 +1,12 @@
+-- Identificar a los pilotos por el driverId de la API (driver_ref) en vez de por su código.
+-- La API reutiliza códigos entre épocas (MSC es Michael y Mick Schumacher), así que
+-- driver_code deja de ser único.
+--
+-- Las filas existentes quedan con driver_ref nulo; main.py se lo asigna la próxima vez
+-- que escribe una temporada con un piloto del mismo código y nombre completo.
+--   psql "$DATABASE_URL" -f supabase/migrations/20261017120000_drivers_driver_ref.sql
+
+ALTER TABLE drivers ADD COLUMN IF NOT EXISTS driver_ref text;
+-- Nombre por defecto de la restricción UNIQUE (driver_code)
+ALTER TABLE drivers DROP CONSTRAINT IF EXISTS drivers_driver_code_key;
+CREATE UNIQUE INDEX IF NOT EXISTS drivers_driver_ref_key ON drivers (driver_ref);
@@ -0,0 +1,43 @@
+-- Tablas de vueltas y paradas que carga `python main.py --laps`. Aplicar antes de activar
+-- la variable F1_LOAD_LAPS del workflow:
+--   psql "$DATABASE_URL" -f supabase/migrations/20261017130000_lap_data.sql
+--
+-- lap_data_loads anota cada carrera cargada por tabla con sus filas, también las que
+-- la API no tiene (no hay paradas antes de 2011), para no volver a pedirlas.
+
+CREATE TABLE IF NOT EXISTS lap_times (
+    id bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    race_id bigint NOT NULL REFERENCES calendar (id),
+    driver_id bigint NOT NULL REFERENCES drivers (id),
+    season_year integer NOT NULL,
+    lap_number integer NOT NULL,
+    position integer,
+    lap_time text,
+    milliseconds integer,
+    updated_at timestamptz DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS lap_times_race_id_idx ON lap_times (race_id);
+
+CREATE TABLE IF NOT EXISTS pit_stops (
+    id bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    race_id bigint NOT NULL REFERENCES calendar (id),
+    driver_id bigint NOT NULL REFERENCES drivers (id),
+    season_year integer NOT NULL,
+    stop_number integer NOT NULL,
+    lap_number integer NOT NULL,
+    time_of_day text,
+    duration text,
+    milliseconds integer,
+    updated_at timestamptz DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS pit_stops_race_id_idx ON pit_stops (race_id);
+
+CREATE TABLE IF NOT EXISTS lap_data_loads (
+    race_id bigint NOT NULL REFERENCES calendar (id),
+    season_year integer NOT NULL,
+    dataset text NOT NULL,
+    row_count integer NOT NULL,
+    updated_at timestamptz DEFAULT now(),
+    PRIMARY KEY (race_id, dataset)
+);
+CREATE INDEX IF NOT EXISTS lap_data_loads_season_idx ON lap_data_loads (season_year);